@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#**************************************************************************
+#   Copyright (C) 2018, Paul Lutus                                        *
+#                                                                         *
+#   This program is free software; you can redistribute it and/or modify  *
+#   it under the terms of the GNU General Public License as published by  *
+#   the Free Software Foundation; either version 2 of the License, or     *
+#   (at your option) any later version.                                   *
+#                                                                         *
+#   This program is distributed in the hope that it will be useful,       *
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+#   GNU General Public License for more details.                          *
+#                                                                         *
+#   You should have received a copy of the GNU General Public License     *
+#   along with this program; if not, write to the                         *
+#   Free Software Foundation, Inc.,                                       *
+#   59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.             *
+#**************************************************************************
+
+import sys
+import time
+
+from gnuradio import blocks
+from gnuradio import filter
+from gnuradio import gr
+
+# chooses between a direct-form FIR and an FFT overlap-save
+# filter. a direct decimating filter computes only the kept
+# outputs, costing ntaps/decimation per input sample, while
+# the FFT filter's cost grows only with log(ntaps).
+# run this file to measure the crossover on this machine,
+# then set 'fft_filter_crossover' in the configuration file
+
+# direct-form taps per input sample above which FFT filtering wins
+crossover_taps = 64
+
+direct_filters = {
+  'ccf' : filter.fir_filter_ccf,
+  'ccc' : filter.fir_filter_ccc,
+  'fff' : filter.fir_filter_fff,
+}
+
+fft_filters = {
+  'ccf' : filter.fft_filter_ccf,
+  'ccc' : filter.fft_filter_ccc,
+  'fff' : filter.fft_filter_fff,
+}
+
+item_sizes = {
+  'ccf' : gr.sizeof_gr_complex,
+  'ccc' : gr.sizeof_gr_complex,
+  'fff' : gr.sizeof_float,
+}
+
+def set_crossover(taps):
+  global crossover_taps
+  crossover_taps = max(1,int(taps))
+
+def use_fft(ntaps,decimation = 1):
+  return float(ntaps) / decimation >= crossover_taps
+
+# kind is one of 'ccf', 'ccc', 'fff'
+def make_filter(kind,decimation,taps):
+  if use_fft(len(taps),decimation):
+    return fft_filters[kind](int(decimation),taps)
+  return direct_filters[kind](int(decimation),taps)
+
+# seconds to push nsamples through one filter
+def time_filter(factory,kind,ntaps,nsamples):
+  size = item_sizes[kind]
+  tb = gr.top_block()
+  src = blocks.null_source(size)
+  head = blocks.head(size, nsamples)
+  flt = factory(1, [1.0/ntaps] * ntaps)
+  sink = blocks.null_sink(size)
+  tb.connect(src, head, flt, sink)
+  t = time.time()
+  tb.run()
+  return time.time() - t
+
+# returns rows of (ntaps, direct Msps, fft Msps)
+def benchmark(kind = 'ccf',nsamples = 4000000,sizes = None):
+  if sizes == None:
+    sizes = [2**n for n in range(3,12)]
+  results = []
+  for ntaps in sizes:
+    td = time_filter(direct_filters[kind],kind,ntaps,nsamples)
+    tf = time_filter(fft_filters[kind],kind,ntaps,nsamples)
+    results.append((ntaps,nsamples/td/1e6,nsamples/tf/1e6))
+  return results
+
+# the smallest tap count at which FFT filtering is faster
+def crossover(results):
+  for ntaps,direct,fft in results:
+    if fft > direct:
+      return ntaps
+  return None
+
+if __name__ == "__main__":
+  kinds = sys.argv[1:]
+  if len(kinds) == 0:
+    kinds = ['ccf','fff']
+  for kind in kinds:
+    results = benchmark(kind)
+    print("%s filters, Msamples/s:" % kind)
+    print("%6s %10s %10s" % ('taps','direct','fft'))
+    for ntaps,direct,fft in results:
+      print("%6d %10.1f %10.1f" % (ntaps,direct,fft))
+    print("crossover: %s taps\n" % crossover(results))
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#**************************************************************************
+#   Copyright (C) 2018, Paul Lutus                                        *
+#                                                                         *
+#   This program is free software; you can redistribute it and/or modify  *
+#   it under the terms of the GNU General Public License as published by  *
+#   the Free Software Foundation; either version 2 of the License, or     *
+#   (at your option) any later version.                                   *
+#                                                                         *
+#   This program is distributed in the hope that it will be useful,       *
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+#   GNU General Public License for more details.                          *
+#                                                                         *
+#   You should have received a copy of the GNU General Public License     *
+#   along with this program; if not, write to the                         *
+#   Free Software Foundation, Inc.,                                       *
+#   59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.             *
+#**************************************************************************
+
+import math
+
+from gnuradio import analog
+from gnuradio import blocks
+from gnuradio import filter
+from gnuradio import gr
+from gnuradio.filter import firdes
+from gnuradio.filter import pfb
+
+import TapCache
+
+# simultaneous reception of many channels inside the device
+# passband. one polyphase filter bank splits the whole capture
+# into channels of equal spacing, so the cost is one FFT bank
+# however many channels are monitored, instead of one
+# translating filter per channel at the full device rate
+
+# half the bandwidth of a monitored channel, as a fraction
+# of the channel spacing
+CHANNEL_HALF_WIDTH = 0.3
+
+# one monitored channel at the channelizer's output rate:
+# a rotator removes the channel's distance from its bin center,
+# a low-pass keeps the channel and drops its neighbors, then
+# squelch and a lightweight detector
+class MonitorChannel(gr.hier_block2):
+  def __init__(self,freq,mode,label,channel_rate,spacing,squelch_level):
+    gr.hier_block2.__init__(
+      self, "Monitor Channel",
+      gr.io_signature(1, 1, gr.sizeof_gr_complex),
+      gr.io_signature(1, 1, gr.sizeof_float),
+      )
+    self.freq = freq
+    self.mode = mode
+    self.label = label
+    self.channel_rate = channel_rate
+    self.bin = None
+    self.rotator = blocks.rotator_cc(0)
+    half_width = spacing * CHANNEL_HALF_WIDTH
+    taps = TapCache.shared.low_pass(
+      1, channel_rate, half_width, spacing * 0.1, firdes.WIN_BLACKMAN_HARRIS)
+    self.filter = filter.fir_filter_ccf(1, taps)
+    # gate=False outputs zeros while closed, so closed
+    # channels add silence to the mix
+    self.squelch = analog.pwr_squelch_cc(squelch_level, 1e-3, 0, False)
+    if mode in ('FM','WFM'):
+      self.detector = analog.quadrature_demod_cf(channel_rate / (2 * math.pi * 5e3))
+    elif mode == 'AM':
+      self.detector = blocks.complex_to_mag(1)
+    else:
+      self.detector = blocks.complex_to_real(1)
+    self.connect(self, self.rotator, self.filter, self.squelch, self.detector, self)
+
+  def set_residual(self,residual):
+    self.rotator.set_phase_inc(-2 * math.pi * residual / self.channel_rate)
+
+  def set_squelch(self,level):
+    self.squelch.set_threshold(level)
+
+  def is_open(self):
+    return self.squelch.unmuted()
+
+# channels is a list of (frequency Hz, mode, label)
+class Channelizer(gr.hier_block2):
+  def __init__(self,sample_rate,audio_rate,spacing,channels,squelch_level):
+    gr.hier_block2.__init__(
+      self, "Channelizer",
+      gr.io_signature(1, 1, gr.sizeof_gr_complex),
+      gr.io_signature(1, 1, gr.sizeof_float),
+      )
+    self.sample_rate = sample_rate
+    # an even channel count, the bank can only oversample by 2 then
+    self.nchans = max(1,int(round(float(sample_rate) / spacing / 2))) * 2
+    self.spacing = float(sample_rate) / self.nchans
+    # a channel can sit up to half a spacing from its bin center,
+    # so each bin passes that much plus the channel's half width.
+    # oversampling by 2 gives the output room for it, the
+    # transition band ends at the output Nyquist frequency
+    self.oversample = 2
+    self.channel_rate = self.spacing * self.oversample
+    pass_f = self.spacing * (0.5 + CHANNEL_HALF_WIDTH)
+    transition = self.spacing - pass_f
+    taps = TapCache.shared.low_pass(
+      1, sample_rate, pass_f + transition / 2, transition, firdes.WIN_BLACKMAN_HARRIS)
+    self.pfb = pfb.channelizer_ccf(self.nchans, taps, self.oversample)
+    self.unused_sink = blocks.null_sink(gr.sizeof_gr_complex)
+    self.silence = blocks.null_source(gr.sizeof_float)
+    self.resampler = pfb.arb_resampler_fff(float(audio_rate) / self.channel_rate)
+    self.channels = [MonitorChannel(f,m,l,self.channel_rate,self.spacing,squelch_level) for f,m,l in channels]
+    self.center_freq = None
+
+  # bin index and residual offset for a channel, or None if
+  # the channel lies outside the usable passband
+  def locate(self,channel,center_freq):
+    df = channel.freq - center_freq
+    if abs(df) > (self.sample_rate - self.spacing) / 2:
+      return None
+    n = int(round(df / self.spacing))
+    return n % self.nchans,df - n * self.spacing
+
+  # True if a retune moves any channel to a different bin,
+  # which requires rewiring under the top block's lock
+  def needs_rewire(self,center_freq):
+    for channel in self.channels:
+      loc = self.locate(channel,center_freq)
+      if (loc == None and channel.bin != None) or (loc != None and loc[0] != channel.bin):
+        return True
+    return False
+
+  def retune(self,center_freq):
+    rewire = self.center_freq == None or self.needs_rewire(center_freq)
+    self.center_freq = center_freq
+    for channel in self.channels:
+      loc = self.locate(channel,center_freq)
+      if loc == None:
+        channel.bin = None
+      else:
+        channel.bin,residual = loc
+        channel.set_residual(residual)
+    if rewire:
+      self.wire()
+
+  def wire(self):
+    self.disconnect_all()
+    self.connect(self, self.pfb)
+    active = [c for c in self.channels if c.bin != None]
+    used = set([c.bin for c in active])
+    # the sink's inputs must be contiguous from 0
+    unused = [n for n in range(self.nchans) if n not in used]
+    for port,n in enumerate(unused):
+      self.connect((self.pfb, n), (self.unused_sink, port))
+    # a fresh adder, its input count follows the active channels
+    self.mixer = blocks.add_ff(1)
+    if len(active) == 0:
+      self.connect(self.silence, (self.mixer, 0))
+    for n,channel in enumerate(active):
+      self.connect((self.pfb, channel.bin), channel)
+      self.connect(channel, (self.mixer, n))
+    self.connect(self.mixer, self.resampler, self)
+
+  def set_squelch(self,level):
+    for channel in self.channels:
+      channel.set_squelch(level)
+
+  def active_channels(self):
+    return [c for c in self.channels if c.bin != None]
+
+  def open_channels(self):
+    return [c for c in self.active_channels() if c.is_open()]
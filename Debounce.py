@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#**************************************************************************
+#   Copyright (C) 2018, Paul Lutus                                        *
+#                                                                         *
+#   This program is free software; you can redistribute it and/or modify  *
+#   it under the terms of the GNU General Public License as published by  *
+#   the Free Software Foundation; either version 2 of the License, or     *
+#   (at your option) any later version.                                   *
+#                                                                         *
+#   This program is distributed in the hope that it will be useful,       *
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+#   GNU General Public License for more details.                          *
+#                                                                         *
+#   You should have received a copy of the GNU General Public License     *
+#   along with this program; if not, write to the                         *
+#   Free Software Foundation, Inc.,                                       *
+#   59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.             *
+#**************************************************************************
+
+from PyQt5 import QtCore
+
+# rate limits the calls a control makes into the radio.
+# the first call of a burst goes through at once, later
+# calls within interval_ms only replace the pending
+# arguments, which are sent when the interval ends, so a
+# slider sweep sends one call per interval and always
+# finishes on its final value. an interval of 0 calls through
+
+class Debouncer():
+  def __init__(self,function,interval_ms = 0):
+    self.function = function
+    self.interval = int(interval_ms)
+    self.args = None
+    self.requested = 0
+    self.sent = 0
+    self.timer = None
+    if self.interval > 0:
+      self.timer = QtCore.QTimer()
+      self.timer.setSingleShot(True)
+      self.timer.timeout.connect(self.trailing)
+
+  def __call__(self,*args):
+    self.requested += 1
+    if self.timer == None:
+      self.send(args)
+    elif self.timer.isActive():
+      self.args = args
+    else:
+      self.send(args)
+      self.timer.start(self.interval)
+
+  def trailing(self):
+    if self.args != None:
+      args = self.args
+      self.args = None
+      self.send(args)
+      self.timer.start(self.interval)
+
+  def send(self,args):
+    self.sent += 1
+    self.function(*args)
@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#**************************************************************************
+#   Copyright (C) 2018, Paul Lutus                                        *
+#                                                                         *
+#   This program is free software; you can redistribute it and/or modify  *
+#   it under the terms of the GNU General Public License as published by  *
+#   the Free Software Foundation; either version 2 of the License, or     *
+#   (at your option) any later version.                                   *
+#                                                                         *
+#   This program is distributed in the hope that it will be useful,       *
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+#   GNU General Public License for more details.                          *
+#                                                                         *
+#   You should have received a copy of the GNU General Public License     *
+#   along with this program; if not, write to the                         *
+#   Free Software Foundation, Inc.,                                       *
+#   59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.             *
+#**************************************************************************
+
+import math
+
+from gnuradio import blocks
+from gnuradio import filter
+from gnuradio import gr
+from gnuradio.filter import firdes
+
+import ChannelFilter
+import TapCache
+
+# the same design constants gnuradio's rational_resampler
+# uses when given taps=None, so the cost figures compare
+# like with like
+FRACTIONAL_BW = 0.4
+KAISER_BETA = 7.0
+
+# rational stages needing more polyphase branches than this
+# are replaced by an arbitrary resampler with this many filters
+ARB_FILTER_SIZE = 32
+
+# attenuation in dB, mirrors firdes::compute_ntaps for a Kaiser window
+def kaiser_attenuation(beta = KAISER_BETA):
+  return beta / 0.1102 + 8.7
+
+# predicts the tap count firdes will produce for a Kaiser design
+def estimate_ntaps(sampling_freq,transition_width,beta = KAISER_BETA):
+  ntaps = int(kaiser_attenuation(beta) * sampling_freq / (22.0 * transition_width))
+  return ntaps | 1
+
+# one filter in the cascade: an integer decimator (interp == 1)
+# or a rational polyphase resampler
+class DecimationStage():
+  def __init__(self,rate_in,interp,dec,pass_f,stop_f):
+    self.rate_in = rate_in
+    self.interp = interp
+    self.dec = dec
+    self.rate_out = rate_in * interp / dec
+    self.pass_f = pass_f
+    self.stop_f = stop_f
+
+  # the prototype filter runs at the interpolated rate
+  def filter_rate(self):
+    return self.rate_in * self.interp
+
+  def ntaps(self):
+    return estimate_ntaps(self.filter_rate(),self.stop_f - self.pass_f)
+
+  # polyphase cost: each output sample uses ntaps/interp taps,
+  # and there are interp/dec outputs per input sample
+  def macs_per_input(self):
+    return float(self.ntaps()) / self.dec
+
+  def taps(self):
+    return TapCache.shared.low_pass(
+      self.interp, self.filter_rate(), (self.pass_f + self.stop_f) / 2.0,
+      self.stop_f - self.pass_f, firdes.WIN_KAISER, KAISER_BETA)
+
+  # the same decimation performed by a frequency-translating
+  # filter, which also shifts the channel to zero
+  def make_xlating_block(self,center_freq):
+    return filter.freq_xlating_fir_filter_ccf(
+      int(self.dec), self.taps(), center_freq, self.rate_in)
+
+  def make_block(self):
+    if self.interp == 1:
+      return ChannelFilter.make_filter('ccf', self.dec, self.taps())
+    return filter.rational_resampler_ccc(
+      interpolation=int(self.interp),
+      decimation=int(self.dec),
+      taps=self.taps(),
+      fractional_bw=None,
+      )
+
+  def describe(self):
+    if self.interp == 1:
+      return "/%d" % self.dec
+    return "*%d/%d" % (self.interp,self.dec)
+
+# a polyphase arbitrary resampler, used when the reduced
+# interp/dec ratio would need an enormous rational filter bank
+# (e.g. 64 kHz -> 44.1 kHz is 441/640)
+class ArbitraryStage(DecimationStage):
+  def __init__(self,rate_in,interp,dec,pass_f,stop_f,flt_size = ARB_FILTER_SIZE):
+    DecimationStage.__init__(self,rate_in,interp,dec,pass_f,stop_f)
+    self.flt_size = flt_size
+    # not necessarily interp/dec, the input rate may be fractional
+    self.rate_out = stop_f * 2.0
+    self.rate = self.rate_out / rate_in
+
+  def filter_rate(self):
+    return self.rate_in * self.flt_size
+
+  # each output uses ntaps/flt_size taps in both the filter
+  # and its derivative, and there are rate outputs per input
+  def macs_per_input(self):
+    return 2.0 * self.ntaps() / self.flt_size * self.rate
+
+  def taps(self):
+    return TapCache.shared.low_pass(
+      self.flt_size, self.filter_rate(), (self.pass_f + self.stop_f) / 2.0,
+      self.stop_f - self.pass_f, firdes.WIN_KAISER, KAISER_BETA)
+
+  def make_block(self):
+    return filter.pfb_arb_resampler_ccf(self.rate, self.taps(), self.flt_size)
+
+  def describe(self):
+    return "arb*%.5f" % self.rate
+
+# factors a sample rate conversion into a cascade of
+# cheap decimate-by-2 stages followed by one polyphase stage
+# that does the remaining (possibly fractional) conversion
+# if front_end is True, the leading integer stages are merged
+# into front_end_stage, to be realized as a frequency-translating
+# filter running at the device rate
+class DecimationPlan():
+  def __init__(self,rate_in,rate_out,fractional_bw = FRACTIONAL_BW,front_end = False):
+    self.rate_in = int(rate_in)
+    self.rate_out = int(rate_out)
+    self.fractional_bw = fractional_bw
+    self.stages = []
+    self.front_end_stage = None
+    self.plan()
+    if front_end:
+      self.plan_front_end()
+
+  def plan(self):
+    # passband edge that every stage must preserve
+    pass_f = self.fractional_bw * self.rate_out
+    rate = self.rate_in
+    # halve while the halved rate is still no lower than the
+    # output rate. Aliases from each halving land above pass_f
+    # and are removed later. An odd rate halves to a fractional
+    # one, which only the arbitrary resampler can finish.
+    while rate / 2 >= self.rate_out:
+      half = rate / 2
+      if rate % 2 == 0:
+        half = rate // 2
+      self.stages.append(DecimationStage(rate,1,2,pass_f,half - pass_f))
+      rate = half
+    if rate != self.rate_out:
+      integral = rate == int(rate)
+      gcd = math.gcd(int(rate),self.rate_out)
+      interp = self.rate_out // gcd
+      dec = int(rate) // gcd
+      if not integral or interp > ARB_FILTER_SIZE:
+        stage = ArbitraryStage(rate,interp,dec,pass_f,self.rate_out / 2.0)
+      else:
+        stage = DecimationStage(rate,interp,dec,pass_f,self.rate_out / 2.0)
+      self.stages.append(stage)
+    elif len(self.stages) > 0:
+      # the last halving is the final stage, tighten its stopband
+      self.stages[-1].stop_f = self.rate_out / 2.0
+
+  # merge the run of leading integer stages that gives
+  # the cheapest single decimating filter, wider merges
+  # trade more taps for fewer stages
+  def plan_front_end(self):
+    pass_f = self.fractional_bw * self.rate_out
+    best = None
+    dec = 1
+    replaced = 0.0
+    rate = float(self.rate_in)
+    for n,stage in enumerate(self.stages):
+      if stage.interp != 1:
+        break
+      replaced += stage.macs_per_input() * rate / self.rate_in
+      rate = stage.rate_out
+      dec *= stage.dec
+      merged = DecimationStage(self.rate_in,1,dec,pass_f,stage.stop_f)
+      saving = replaced - merged.macs_per_input()
+      if best == None or saving >= best[0]:
+        best = (saving,n+1,merged)
+    if best != None:
+      _,count,self.front_end_stage = best
+      self.stages = self.stages[count:]
+
+  # the rate the front end hands to the rest of the chain
+  def front_end_rate(self):
+    if self.front_end_stage == None:
+      return self.rate_in
+    return self.front_end_stage.rate_out
+
+  # how far from the device LO the front end can place the
+  # channel center, keeping the channel and the filter's
+  # transition band inside the device passband less guard (a
+  # fraction of the device rate) at each edge. without a front
+  # end there is no room, the LO must follow every retune
+  def xlate_range(self,guard):
+    stage = self.front_end_stage
+    if stage == None:
+      return 0
+    half_width = self.fractional_bw * self.rate_out
+    edge = self.rate_in * (.5 - guard) - half_width - (stage.stop_f - stage.pass_f)
+    return max(0,edge)
+
+  # multiply-accumulates per input (device) sample
+  def macs_per_sample(self):
+    total = 0.0
+    rate = float(self.rate_in)
+    if self.front_end_stage != None:
+      total += self.front_end_stage.macs_per_input()
+      rate = self.front_end_stage.rate_out
+    for stage in self.stages:
+      total += stage.macs_per_input() * rate / self.rate_in
+      rate = stage.rate_out
+    return total
+
+  def total_taps(self):
+    total = sum([stage.ntaps() for stage in self.stages])
+    if self.front_end_stage != None:
+      total += self.front_end_stage.ntaps()
+    return total
+
+  def uses_arbitrary_resampler(self):
+    return len([s for s in self.stages if isinstance(s,ArbitraryStage)]) > 0
+
+  # short form for the status line
+  def summary(self):
+    s = "%.1f MAC/sample" % self.macs_per_sample()
+    if self.uses_arbitrary_resampler():
+      s += " arb"
+    return s
+
+  # cost of the single default rational_resampler_ccc this plan replaces
+  def legacy_macs_per_sample(self):
+    gcd = math.gcd(self.rate_in,self.rate_out)
+    interp = self.rate_out // gcd
+    dec = self.rate_in // gcd
+    rate = float(interp) / dec
+    halfband = 0.5
+    if rate >= 1.0:
+      trans_width = halfband - self.fractional_bw
+    else:
+      trans_width = rate * (halfband - self.fractional_bw)
+    ntaps = estimate_ntaps(interp,trans_width)
+    return float(ntaps) / dec
+
+  def describe(self):
+    stages = [stage.describe() for stage in self.stages]
+    if self.front_end_stage != None:
+      stages.insert(0,"xlate%s" % self.front_end_stage.describe())
+    stages = ' '.join(stages)
+    if len(stages) == 0:
+      stages = "none"
+    return "%d -> %d Hz: %s, %.1f MAC/sample, %d taps (single stage: %.1f)" % (
+      self.rate_in,
+      self.rate_out,
+      stages,
+      self.macs_per_sample(),
+      self.total_taps(),
+      self.legacy_macs_per_sample(),
+      )
+
+# the blocks of a DecimationPlan wired in series
+class DecimationChain(gr.hier_block2):
+  def __init__(self,plan):
+    gr.hier_block2.__init__(
+      self, "Decimation Chain",
+      gr.io_signature(1, 1, gr.sizeof_gr_complex),
+      gr.io_signature(1, 1, gr.sizeof_gr_complex),
+      )
+    self.plan = plan
+    self.stage_blocks = [stage.make_block() for stage in plan.stages]
+    if len(self.stage_blocks) == 0:
+      self.stage_blocks.append(blocks.copy(gr.sizeof_gr_complex))
+    prev = self
+    for block in self.stage_blocks:
+      self.connect(prev,block)
+      prev = block
+    self.connect(prev,self)
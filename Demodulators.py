@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#**************************************************************************
+#   Copyright (C) 2018, Paul Lutus                                        *
+#                                                                         *
+#   This program is free software; you can redistribute it and/or modify  *
+#   it under the terms of the GNU General Public License as published by  *
+#   the Free Software Foundation; either version 2 of the License, or     *
+#   (at your option) any later version.                                   *
+#                                                                         *
+#   This program is distributed in the hope that it will be useful,       *
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+#   GNU General Public License for more details.                          *
+#                                                                         *
+#   You should have received a copy of the GNU General Public License     *
+#   along with this program; if not, write to the                         *
+#   Free Software Foundation, Inc.,                                       *
+#   59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.             *
+#**************************************************************************
+
+from gnuradio import analog
+from gnuradio import blocks
+from gnuradio import filter
+from gnuradio import gr
+from gnuradio.filter import firdes
+
+import ChannelFilter
+import Decimator
+import TapCache
+
+# each receive mode is a self-contained subgraph:
+# device-rate complex samples in, audio-rate floats out.
+# to add a mode, subclass Demodulator, implement build(config)
+# and filter_taps(value), which returns the channel filter taps
+# for bandwidth index value, and add it to the registry at the bottom
+
+class Demodulator(gr.hier_block2):
+  # True if the mode runs at the radio's IF rate
+  # rather than the audio rate
+  wide = False
+  # -1, 0 or 1 times half the CW base frequency
+  cw_offset_sign = 0
+  # Radio.config_snapshot keys that invalidate a built instance
+  depends = ('sample_rate','audio_rate','front_end_xlate')
+
+  def __init__(self,radio,config):
+    gr.hier_block2.__init__(
+      self, self.__class__.__name__,
+      gr.io_signature(1, 1, gr.sizeof_gr_complex),
+      gr.io_signature(1, 1, gr.sizeof_float),
+      )
+    self.radio = radio
+    self.plan = radio.decimation_plan(self.wide)
+    self.rate = self.plan.rate_out
+    self.channel_filter = None
+    self.squelch = None
+    self.squelch_ssb = None
+    self.agc = None
+    self.build_front_end()
+    self.build(config)
+
+  # in front-end mode the translating filter runs at the
+  # device rate and also performs the first decimation,
+  # otherwise it runs after the decimator at the demodulator rate
+  def build_front_end(self):
+    center_f = self.radio.compute_offset_f(False)
+    self.decimator = Decimator.DecimationChain(self.plan)
+    if self.plan.front_end_stage != None:
+      self.freq_xlating_fir_filter = self.plan.front_end_stage.make_xlating_block(center_f)
+      self.connect(self, self.freq_xlating_fir_filter, self.decimator)
+      self.channel = self.decimator
+    else:
+      rate = self.rate
+      fir_taps = TapCache.shared.complex_band_pass(1, rate, -rate/2, rate/2, rate/2)
+      self.freq_xlating_fir_filter = filter.freq_xlating_fir_filter_ccc(1, fir_taps, center_f, rate)
+      self.connect(self, self.decimator, self.freq_xlating_fir_filter)
+      self.channel = self.freq_xlating_fir_filter
+
+  # direct or FFT filtering, whichever is cheaper for this length
+  def create_channel_filter(self,kind,taps):
+    self.channel_filter_fft = ChannelFilter.use_fft(len(taps))
+    self.channel_filter_ntaps = len(taps)
+    return ChannelFilter.make_filter(kind, 1, taps)
+
+  def filter_report(self):
+    if self.channel_filter == None:
+      return ''
+    return "Channel filter: %s, %d taps" % (('FIR','FFT')[self.channel_filter_fft],self.channel_filter_ntaps)
+
+  def create_agc_cc(self):
+    agc = analog.agc2_cc(1e-1, 1e-2, 1.0, 1.0)
+    agc.set_max_gain(1)
+    return agc
+
+  def create_agc_ff(self):
+    agc = analog.agc2_ff(1e-1, 1e-2, 1.0, 1.0)
+    agc.set_max_gain(1)
+    return agc
+
+  def set_center_freq(self,f):
+    self.freq_xlating_fir_filter.set_center_freq(f)
+
+  # how far from the device LO the translating filter can
+  # place the channel, see DecimationPlan.xlate_range
+  def xlate_range(self,guard):
+    return self.plan.xlate_range(guard)
+
+  def set_squelch(self,level):
+    for squelch in (self.squelch,self.squelch_ssb):
+      if squelch != None:
+        squelch.set_threshold(level)
+
+  def set_agc(self,reference,gain,max_gain,attack_rate,decay_rate):
+    if self.agc != None:
+      self.agc.set_reference(reference)
+      self.agc.set_gain(gain)
+      self.agc.set_max_gain(max_gain)
+      self.agc.set_attack_rate(attack_rate)
+      self.agc.set_decay_rate(decay_rate)
+
+  def rebuild_filters(self,value):
+    self.channel_filter.set_taps(self.filter_taps(value))
+
+class AMDemod(Demodulator):
+  def build(self,config):
+    self.channel_filter = self.create_channel_filter('ccf', self.filter_taps(config['bw_mode']))
+    self.squelch = analog.pwr_squelch_cc(self.radio.squelch_level, 1e-4, 0, True)
+    self.agc = self.create_agc_cc()
+    self.complex_to_mag = blocks.complex_to_mag(1)
+    self.connect(self.channel, self.channel_filter, self.squelch, self.agc, self.complex_to_mag, self)
+
+  def filter_taps(self,value):
+    bw = (8000,3000,2000)[value]
+    return TapCache.shared.low_pass(1, self.rate, bw, 500, firdes.WIN_HAMMING, 6.76)
+
+class FMDemod(Demodulator):
+  def build(self,config):
+    self.channel_filter = self.create_channel_filter('ccf', self.filter_taps(config['bw_mode']))
+    self.squelch = analog.pwr_squelch_cc(self.radio.squelch_level, 1e-4, 0, True)
+    self.agc = self.create_agc_cc()
+    self.nbfm_rcv = analog.nbfm_rx(
+        audio_rate=self.rate,
+        quad_rate=self.rate,
+        tau=75e-6,
+        max_dev=6e3,
+        )
+    self.connect(self.channel, self.channel_filter, self.squelch, self.agc, self.nbfm_rcv, self)
+
+  def filter_taps(self,value):
+    bw = (8000,6000,4000)[value]
+    return TapCache.shared.low_pass(1, self.rate, bw, 500, firdes.WIN_HAMMING, 6.76)
+
+class WFMDemod(Demodulator):
+  wide = True
+
+  def build(self,config):
+    self.channel_filter = self.create_channel_filter('ccf', self.filter_taps(config['bw_mode']))
+    self.squelch = analog.pwr_squelch_cc(self.radio.squelch_level, 1e-4, 0, True)
+    self.agc = self.create_agc_cc()
+    self.wfm_rcv = analog.wfm_rcv(
+        quad_rate=self.rate,
+        audio_decimation=self.rate / self.radio.audio_rate,
+      )
+    self.connect(self.channel, self.channel_filter, self.squelch, self.agc, self.wfm_rcv, self)
+
+  def filter_taps(self,value):
+    bw = (60e3,40e3,20e3)[value]
+    return TapCache.shared.low_pass(1, self.rate, bw, 4e3, firdes.WIN_HAMMING, 6.76)
+
+# phasing-method sideband detector: the I and Q channels
+# pass through Hilbert filters and are summed or differenced,
+# followed by a real audio filter
+class PhasingDetector(gr.hier_block2):
+  def __init__(self,usb,hilbert_taps,channel_filter):
+    gr.hier_block2.__init__(
+      self, "Phasing Detector",
+      gr.io_signature(1, 1, gr.sizeof_gr_complex),
+      gr.io_signature(1, 1, gr.sizeof_float),
+      )
+    self.complex_to_float = blocks.complex_to_float(1)
+    self.hilbert_fc_1 = filter.hilbert_fc(hilbert_taps, firdes.WIN_HAMMING, 6.76)
+    self.hilbert_fc_2 = filter.hilbert_fc(hilbert_taps, firdes.WIN_HAMMING, 6.76)
+    self.complex_to_real = blocks.complex_to_real(1)
+    self.complex_to_imag = blocks.complex_to_imag(1)
+    # changing between USB and LSB requires changing the sign of a multiplication term
+    self.multiply_const = blocks.multiply_const_vff(((1,-1)[usb], ))
+    self.add = blocks.add_vff(1)
+    self.channel_filter = channel_filter
+    self.connect(self, self.complex_to_float)
+    self.connect((self.complex_to_float, 0), (self.hilbert_fc_1, 0))
+    self.connect((self.complex_to_float, 1), (self.hilbert_fc_2, 0))
+    self.connect((self.hilbert_fc_1, 0), (self.complex_to_real, 0))
+    self.connect((self.hilbert_fc_2, 0), (self.complex_to_imag, 0))
+    self.connect((self.complex_to_imag, 0), (self.multiply_const, 0))
+    self.connect((self.multiply_const, 0), (self.add, 1))
+    self.connect((self.complex_to_real, 0), (self.add, 0))
+    self.connect(self.add, self.channel_filter, self)
+
+# filter-method sideband detector: one complex band pass
+# keeps only the wanted sideband, whose real part is the audio
+class FilterDetector(gr.hier_block2):
+  def __init__(self,channel_filter):
+    gr.hier_block2.__init__(
+      self, "Filter Detector",
+      gr.io_signature(1, 1, gr.sizeof_gr_complex),
+      gr.io_signature(1, 1, gr.sizeof_float),
+      )
+    self.channel_filter = channel_filter
+    self.complex_to_real = blocks.complex_to_real(1)
+    self.connect(self, self.channel_filter, self.complex_to_real, self)
+
+# single sideband, by either detector ('ssb_engine' setting)
+class SSBDemod(Demodulator):
+  usb = True
+  depends = Demodulator.depends + ('hilbert_taps','ssb_engine')
+
+  def build(self,config):
+    self.phasing = config['ssb_engine'] == 'phasing'
+    self.squelch = analog.pwr_squelch_cc(self.radio.squelch_level, 1e-4, 0, True)
+    taps = self.filter_taps(config['bw_mode'])
+    if self.phasing:
+      self.channel_filter = self.create_channel_filter('fff', taps)
+      self.detector = PhasingDetector(self.usb, self.radio.hilbert_taps_ssb, self.channel_filter)
+    else:
+      self.channel_filter = self.create_channel_filter('ccc', taps)
+      self.detector = FilterDetector(self.channel_filter)
+    self.squelch_ssb = analog.pwr_squelch_ff(self.radio.squelch_level, 1e-4, 0, True)
+    self.agc = self.create_agc_ff()
+    self.connect(self.channel, self.squelch, self.detector, self.squelch_ssb, self.agc, self)
+
+  # audio passband for bandwidth index value
+  def passband(self,value):
+    return self.radio.ssb_lo,(5000,2400,1800)[value]
+
+  def filter_taps(self,value):
+    lo,hi = self.passband(value)
+    if self.phasing:
+      return self.phasing_taps(lo,hi)
+    # the real part carries half the sideband's power
+    if self.usb:
+      return TapCache.shared.complex_band_pass(2, self.rate, lo, hi, 100, firdes.WIN_HAMMING, 6.76)
+    return TapCache.shared.complex_band_pass(2, self.rate, -hi, -lo, 100, firdes.WIN_HAMMING, 6.76)
+
+  def phasing_taps(self,lo,hi):
+    return TapCache.shared.low_pass(1, self.rate, hi, 100, firdes.WIN_HAMMING, 6.76)
+
+class USBDemod(SSBDemod):
+  usb = True
+
+class LSBDemod(SSBDemod):
+  usb = False
+
+# SSB detection with a passband centered on the CW base frequency
+class CWDemod(SSBDemod):
+  def passband(self,value):
+    cw_base = self.radio.cw_base
+    bw = (cw_base*2/3,cw_base/2,cw_base/3)[value]
+    return cw_base-bw,cw_base+bw
+
+  def phasing_taps(self,lo,hi):
+    return TapCache.shared.band_pass(1, self.rate, lo, hi, 100, firdes.WIN_HAMMING, 6.76)
+
+class CWUSBDemod(CWDemod):
+  usb = True
+  cw_offset_sign = 1
+
+class CWLSBDemod(CWDemod):
+  usb = False
+  cw_offset_sign = -1
+
+# keys match PLSDR.mode_list
+registry = {
+  'AM' : AMDemod,
+  'FM' : FMDemod,
+  'WFM' : WFMDemod,
+  'USB' : USBDemod,
+  'LSB' : LSBDemod,
+  'CW_USB' : CWUSBDemod,
+  'CW_LSB' : CWLSBDemod,
+}
+
+# compares the two SSB detectors' throughput
+def benchmark(rate = 48000,nsamples = 4000000,hilbert_taps = 128):
+  import time
+  results = []
+  for value,bw in enumerate((5000,2400,1800)):
+    row = [bw]
+    engines = (
+      lambda: PhasingDetector(True, hilbert_taps, ChannelFilter.make_filter('fff', 1,
+        firdes.low_pass(1, rate, bw, 100, firdes.WIN_HAMMING, 6.76))),
+      lambda: FilterDetector(ChannelFilter.make_filter('ccc', 1,
+        firdes.complex_band_pass(2, rate, 100, bw, 100, firdes.WIN_HAMMING, 6.76))),
+      )
+    for create in engines:
+      tb = gr.top_block()
+      src = blocks.null_source(gr.sizeof_gr_complex)
+      head = blocks.head(gr.sizeof_gr_complex, nsamples)
+      sink = blocks.null_sink(gr.sizeof_float)
+      tb.connect(src, head, create(), sink)
+      t = time.time()
+      tb.run()
+      row.append(nsamples / (time.time() - t) / 1e6)
+    results.append(row)
+  return results
+
+if __name__ == "__main__":
+  print("SSB detectors, Msamples/s:")
+  print("%6s %10s %10s" % ('bw Hz','phasing','filter'))
+  for bw,phasing,filtered in benchmark():
+    print("%6d %10.1f %10.1f" % (bw,phasing,filtered))
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#**************************************************************************
+#   Copyright (C) 2018, Paul Lutus                                        *
+#                                                                         *
+#   This program is free software; you can redistribute it and/or modify  *
+#   it under the terms of the GNU General Public License as published by  *
+#   the Free Software Foundation; either version 2 of the License, or     *
+#   (at your option) any later version.                                   *
+#                                                                         *
+#   This program is distributed in the hope that it will be useful,       *
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+#   GNU General Public License for more details.                          *
+#                                                                         *
+#   You should have received a copy of the GNU General Public License     *
+#   along with this program; if not, write to the                         *
+#   Free Software Foundation, Inc.,                                       *
+#   59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.             *
+#**************************************************************************
+
+import os
+import ast
+import time
+
+from PyQt5 import QtCore
+
+# what a device can do: gain names and ranges, bandwidths,
+# sample rates and antennas. querying these means USB round
+# trips, so results are kept on disk keyed by driver string,
+# and the controls are filled from the cache. osmosdr has no
+# serial query, so units of one model opened with the same
+# string share an entry, the check below catches a difference.
+# a cached entry is checked against the device on the device
+# thread after each open, and replaced if it has changed
+
+# what a missing or unreadable device reports
+def no_device():
+  return {
+    'gain_names' : [],
+    'gain_ranges' : {},
+    'antennas' : [],
+    'bandwidths' : [],
+    'sample_rates' : [],
+  }
+
+# queries an open osmosdr source, only plain values
+# are kept so the result can be written with repr()
+def probe(source):
+  names = [str(n) for n in source.get_gain_names()]
+  caps = {
+    'gain_names' : names,
+    'gain_ranges' : {},
+    'antennas' : [],
+    'bandwidths' : [float(x) for x in source.get_bandwidth_range().values()],
+    'sample_rates' : [float(x) for x in source.get_sample_rates().values()],
+  }
+  if len(names) > 0:
+    caps['antennas'] = [str(a) for a in source.get_antennas()]
+  for name in names:
+    grange = source.get_gain_range(name).values()
+    # the beginning and end values
+    caps['gain_ranges'][name] = (float(grange[1]),float(grange[-1]))
+  return caps
+
+# carries background probe results to the GUI thread
+class ProbeSignal(QtCore.QObject):
+  probed = QtCore.pyqtSignal(str,object)
+
+class CapabilityCache():
+  def __init__(self):
+    # driver string : (time probed,capabilities)
+    self.entries = {}
+    self.path = None
+    # entries older than this are probed again, 0 disables the cache
+    self.max_age = 30 * 86400
+    self.hits = 0
+    self.misses = 0
+
+  def set_max_age(self,days):
+    self.max_age = max(0,days) * 86400
+
+  def lookup(self,driver):
+    entry = self.entries.get(driver)
+    if entry == None or time.time() - entry[0] > self.max_age:
+      self.misses += 1
+      return None
+    self.hits += 1
+    return entry[1]
+
+  # returns True if the capabilities differ from the cached ones
+  def store(self,driver,caps):
+    entry = self.entries.get(driver)
+    changed = entry == None or entry[1] != caps
+    self.entries[driver] = (time.time(),caps)
+    self.save()
+    return changed
+
+  def invalidate(self,driver):
+    if self.entries.pop(driver,None) != None:
+      self.save()
+
+  def load(self,path):
+    self.path = path
+    if not os.path.exists(path):
+      return
+    try:
+      with open(path) as f:
+        entries = ast.literal_eval(f.read())
+      # entries from before the cache was keyed by driver alone
+      self.entries = dict([(k,v) for k,v in entries.items() if isinstance(k,str)])
+    except Exception as e:
+      print("device cache not loaded: %s" % e)
+      self.entries = {}
+
+  def save(self):
+    if self.path == None:
+      return
+    try:
+      with open(self.path,'w') as f:
+        f.write(repr(self.entries))
+    except Exception as e:
+      print("device cache not saved: %s" % e)
+
+  def report(self):
+    return "Device cache: %d hits, %d misses, %d devices" % (self.hits,self.misses,len(self.entries))
@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#**************************************************************************
+#   Copyright (C) 2018, Paul Lutus                                        *
+#                                                                         *
+#   This program is free software; you can redistribute it and/or modify  *
+#   it under the terms of the GNU General Public License as published by  *
+#   the Free Software Foundation; either version 2 of the License, or     *
+#   (at your option) any later version.                                   *
+#                                                                         *
+#   This program is distributed in the hope that it will be useful,       *
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+#   GNU General Public License for more details.                          *
+#                                                                         *
+#   You should have received a copy of the GNU General Public License     *
+#   along with this program; if not, write to the                         *
+#   Free Software Foundation, Inc.,                                       *
+#   59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.             *
+#**************************************************************************
+
+import time
+import threading
+from concurrent.futures import Future
+
+from PyQt5 import QtCore
+
+# every osmosdr setter runs on one device thread, so a slow
+# driver can't stall the GUI. commands are queued by kind,
+# and gains by kind and name, a command of a kind already
+# waiting replaces its value in place, so a fast drag costs
+# one hardware call per kind per pass instead of one per step.
+# 'freq' retunes are also held to a maximum rate
+
+# kind : function(source,value,name)
+COMMANDS = {
+  'freq' : lambda s,v,n: s.set_center_freq(int(v),0),
+  'freq_corr' : lambda s,v,n: s.set_freq_corr(v,0),
+  'gain' : lambda s,v,n: s.set_gain(v,n,0),
+  'gain_mode' : lambda s,v,n: s.set_gain_mode(v,0),
+  'bandwidth' : lambda s,v,n: s.set_bandwidth(v,0),
+  'bandwidth_reset' : lambda s,v,n: s.set_bandwidth(v),
+  'dc_offset_mode' : lambda s,v,n: s.set_dc_offset_mode(v,0),
+  'iq_balance_mode' : lambda s,v,n: s.set_iq_balance_mode(v,0),
+  'antenna' : lambda s,v,n: s.set_antenna(v),
+  'sample_rate' : lambda s,v,n: s.set_sample_rate(v),
+  # value is a function of the source, its result is the future's
+  'probe' : lambda s,v,n: v(s),
+  # value starts the flowgraph
+  'start' : lambda s,v,n: v(),
+}
+
+# kinds that wait until every command queued ahead of them has run
+BARRIERS = ('start',)
+
+# kinds that run only when nothing else is waiting
+LOW_PRIORITY = ('probe',)
+
+# a command of the first kind drops waiting commands of the
+# second, whose values would otherwise be overwritten by it
+SUPERSEDES = {
+  'bandwidth_reset' : 'bandwidth',
+}
+
+class CommandStats():
+  def __init__(self):
+    self.submitted = 0
+    self.applied = 0
+    self.merged = 0
+    # dropped for a command that overrides them
+    self.superseded = 0
+    self.failed = 0
+    # run while there was no source, nothing reached the device
+    self.no_device = 0
+    # time in the driver, and from first request to completion
+    self.call_ms = 0
+    self.call_max_ms = 0
+    self.latency_ms = 0
+    self.latency_max_ms = 0
+
+  def record(self,call_ms,latency_ms):
+    self.applied += 1
+    self.call_ms += call_ms
+    self.call_max_ms = max(self.call_max_ms,call_ms)
+    self.latency_ms += latency_ms
+    self.latency_max_ms = max(self.latency_max_ms,latency_ms)
+
+  def describe(self,kind):
+    n = max(1,self.applied)
+    s = "%s: %d requested, %d applied, %d merged, %d failed" % (
+      kind,self.submitted,self.applied,self.merged,self.failed)
+    if self.superseded > 0:
+      s += ", %d superseded" % self.superseded
+    if self.no_device > 0:
+      s += ", %d without device" % self.no_device
+    return s + ", call %.1f/%.1f ms, latency %.1f/%.1f ms (mean/max)" % (
+      self.call_ms / n,self.call_max_ms,self.latency_ms / n,self.latency_max_ms)
+
+class DeviceControl(QtCore.QObject):
+  # emitted on the device thread, queued to the GUI thread.
+  # tuned carries the frequency the LO has reached
+  tuned = QtCore.pyqtSignal(float)
+  completed = QtCore.pyqtSignal(str)
+
+  def __init__(self,radio,max_tune_rate = 50):
+    QtCore.QObject.__init__(self)
+    self.radio = radio
+    self.condition = threading.Condition()
+    # (kind,name) : [value,time first requested,future],
+    # in the order first requested
+    self.pending = {}
+    self.running = None
+    # minimum seconds between commands of a kind, and when the next may run
+    self.intervals = {'freq' : 1.0 / max_tune_rate}
+    self.due = {}
+    self.stats = {}
+    self.thread = threading.Thread(target=self.run,name="device control",daemon=True)
+    self.thread.start()
+
+  def set_rate(self,kind,max_rate):
+    self.intervals[kind] = 1.0 / max(1,max_rate)
+
+  # returns a Future that completes when the hardware has
+  # the value, shared by all requests merged into one command.
+  # its result is the value, or what the command returned
+  def submit(self,kind,value,name = None):
+    key = (kind,name)
+    with self.condition:
+      stats = self.stats.setdefault(kind,CommandStats())
+      stats.submitted += 1
+      if key in self.pending:
+        stats.merged += 1
+        command = self.pending[key]
+        command[0] = value
+        return command[2]
+      if kind in SUPERSEDES:
+        dropped = SUPERSEDES[kind]
+        n = self.drop(dropped)
+        if n > 0:
+          self.stats[dropped].superseded += n
+      future = Future()
+      self.pending[key] = [value,time.time(),future]
+      self.condition.notify()
+      return future
+
+  # True while a command of this kind is waiting or running
+  def is_pending(self,kind,name = None):
+    key = (kind,name)
+    with self.condition:
+      return key in self.pending or self.running == key
+
+  def busy(self):
+    with self.condition:
+      return len(self.pending) > 0 or self.running != None
+
+  # drops waiting commands, used when the device changes
+  def reset(self):
+    with self.condition:
+      for value,t,future in self.pending.values():
+        future.cancel()
+      self.pending.clear()
+      self.due.clear()
+
+  # drops a waiting command of a kind and waits for a
+  # running one to finish, so the caller can undo its effect
+  def withdraw(self,kind):
+    with self.condition:
+      self.drop(kind)
+      while self.running != None and self.running[0] == kind:
+        self.condition.wait()
+
+  # drops waiting commands of a kind, called with the lock
+  # held, returns how many were dropped
+  def drop(self,kind):
+    keys = [k for k in self.pending if k[0] == kind]
+    for key in keys:
+      self.pending.pop(key)[2].cancel()
+    return len(keys)
+
+  # the first waiting command whose kind may run now,
+  # else the time until one can
+  def next_command(self):
+    now = time.time()
+    wait = None
+    keys = [k for k in self.pending if k[0] not in LOW_PRIORITY]
+    if len(keys) == 0:
+      keys = list(self.pending)
+    for key in keys:
+      if key[0] in BARRIERS and wait != None:
+        break
+      due = self.due.get(key[0],0)
+      if due <= now:
+        return key,None
+      wait = (wait,due - now)[wait == None or due - now < wait]
+    return None,wait
+
+  def run(self):
+    while True:
+      with self.condition:
+        key,wait = self.next_command()
+        while key == None:
+          self.condition.wait(wait)
+          key,wait = self.next_command()
+        value,t0,future = self.pending.pop(key)
+        self.running = key
+      kind,name = key
+      if not future.set_running_or_notify_cancel():
+        with self.condition:
+          self.running = None
+          self.condition.notify_all()
+        continue
+      t = time.time()
+      source = self.radio.osmosdr_source
+      applied = False
+      try:
+        result = None
+        if source != None:
+          result = COMMANDS[kind](source,value,name)
+          applied = True
+          done = time.time()
+          self.stats[kind].record((done - t) * 1000,(done - t0) * 1000)
+        else:
+          self.stats[kind].no_device += 1
+        future.set_result((result,value)[result == None])
+      except Exception as e:
+        print("device command %s failed: %s" % (kind,e))
+        self.stats[kind].failed += 1
+        future.set_exception(e)
+      if kind == 'freq' and applied:
+        self.tuned.emit(value)
+      with self.condition:
+        if kind in self.intervals:
+          self.due[kind] = t + self.intervals[kind]
+        self.running = None
+        self.condition.notify_all()
+      self.completed.emit(kind)
+
+  def report(self):
+    with self.condition:
+      s = [self.stats[kind].describe(kind) for kind in sorted(self.stats)]
+    if len(s) == 0:
+      return ''
+    return "Device commands:\n" + '\n'.join(s)
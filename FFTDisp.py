@@ -34,7 +34,16 @@ from PyQt5 import QtCore,QtGui
 from PyQt5.QtCore import QEvent
 from PyQt5 import QtWidgets
 from PyQt5.QtWidgets import QWidget
-from PyQt5.QtGui import QColor,QImage,QPainter,QFont,QGuiApplication
+from PyQt5.QtGui import QColor,QImage,QPainter,QFont,QGuiApplication,QPixmap,QStaticText
+
+# events that carry a mouse position
+position_events = (
+  QtGui.QMouseEvent,
+  QtGui.QWheelEvent,
+  QtGui.QContextMenuEvent,
+  QtGui.QHoverEvent,
+  QtGui.QEnterEvent,
+)
 
 class FFTDispWidget(QWidget):
   def __init__(self,main,config,parent_widget):
@@ -46,7 +55,19 @@ class FFTDispWidget(QWidget):
     self.dw = None
     self.dh = None
     self.dwd2 = None
-    self.data = None
+    # the trace, its points live in a NumPy view
+    # of the polygon's own memory
+    self.polygon = None
+    self.trace = None
+    self.trace_key = None
+    self.lod_edges = None
+    self.paint_ms = 0
+    # background, center line and scales, redrawn
+    # only when one of the settings in the key changes
+    self.overlay = None
+    self.overlay_key = None
+    self.static_texts = {}
+    self.trace_due = 0
     self.drawing = False
     self.mousepos = None
     self.mouse_startx = None
@@ -57,7 +78,15 @@ class FFTDispWidget(QWidget):
     self.mousey = 0
     self.mpa = 0
     self.mpb = 1
+    # the displayed slice of the LO-centered spectrum
+    self.view_a = 0
+    self.view_b = 1
     self.ss = 0
+    # radio parameters, kept current by the parameter store
+    self.cf = 0
+    self.sr = 0
+    self.srd2 = 0
+    self.offset_f = 0
     # this smooths out the s-meter reading
     self.integ_constant = 1/5.0
     self.disp_trace_color = QColor(config['disp_trace_color'])
@@ -68,7 +97,10 @@ class FFTDispWidget(QWidget):
     self.process_zoom(self.config['fft_zoom'])
     self.installEventFilter(self)
     self.setMouseTracking(True)
-    self.acquire_params()
+    self.acquire_essential()
+    main.params.subscribe('freq',self.set_center_freq)
+    main.params.subscribe('sample_rate',self.set_sample_rate)
+    main.params.subscribe('offset',self.set_offset)
     
   def reset_magnification(self):
     self.config['dbscale_lo'] = -120
@@ -78,16 +110,18 @@ class FFTDispWidget(QWidget):
   def acquire_essential(self):
     self.dh = self.height()
     self.dw = self.width()
-    self.cf = self.config['freq']
     self.dwd2 = self.dw/2
     
-  def acquire_params(self):
-    self.acquire_essential()
-    self.cf = self.config['freq']
-    # now that this relies on a response from the radio,
-    # this call may wrongly return zero
-    self.sr = self.main.sample_rate_control.get_value()
-    self.srd2 = self.sr/2
+  def set_center_freq(self,f):
+    self.cf = f
+    
+  # until the radio reports a rate this may be zero
+  def set_sample_rate(self,sr):
+    self.sr = sr
+    self.srd2 = sr/2
+    
+  def set_offset(self,f):
+    self.offset_f = f
   
   def process_zoom(self,z):
     z = (z,.499)[z > .499]
@@ -95,14 +129,15 @@ class FFTDispWidget(QWidget):
     self.mpa = z
     self.mpb = 1-z
     self.zoom = z
+    self.main.params.set('zoom',z)
     return z
   
   def eventFilter(self, object, evt):
     lo = self.config['dbscale_lo']
     hi = self.config['dbscale_hi']
-    self.acquire_params()
+    self.acquire_essential()
     t = evt.type()
-    if 'pos' in dir(evt):
+    if isinstance(evt,position_events):
       self.mp = evt.pos()
       self.mousex = float(self.mp.x())
       self.mousey = float(self.mp.y())
@@ -150,8 +185,7 @@ class FFTDispWidget(QWidget):
       if t == QEvent.MouseButtonDblClick:
         # double-click assigns frequency
         # of mouse cursor location
-        dx = self.zoom_scale(self.mousex/self.dw)
-        f = self.ntrp(dx,0,1,self.cf-self.srd2,self.cf+self.srd2)
+        f = self.freq_at(self.mousex/self.dw)
         self.main.assign_freq(f)
       if t == QEvent.MouseButtonPress:
         # start mouse drag mode
@@ -171,101 +205,176 @@ class FFTDispWidget(QWidget):
     if not self.drawing:
       self.acquire_essential()
       ll = len(source)
-      dest = []
       mpa = self.mpa
       mpb = self.mpb
       # shift displayed spectrum by offset frequency
       if self.zoom != None and self.zoom > 0 and self.sr != 0:
-        df = float(self.main.radio.compute_offset_f()) / self.sr
+        df = float(self.offset_f) / self.sr
         mpa -= df
         mpb -= df
         mpa = (mpa,0)[mpa < 0]
         mpb = (mpb,1)[mpb > 1]
+      self.view_a = mpa
+      self.view_b = mpb
       pa = int(mpa * ll)
       pb = int(mpb * ll)
       sz = pb-pa
       if(sz > 0):
         # select zoomed data array segment
         wfdest = source[pa:pb]
-        v = wfdest[int(sz/2)]
+        v = float(wfdest[int(sz/2)])
         self.ss += (v-self.ss) * self.integ_constant
         self.main.signal_progress_bar.setValue(self.ss)
         self.main.signal_progress_bar.setFormat("%.1f db" % self.ss)
         self.main.waterfall_widget.accept_data_line(wfdest)
         lo = self.config['dbscale_lo']
         hi = self.config['dbscale_hi']
-        for x,y in enumerate(wfdest):
-          px = self.ntrp(x,0,sz,0,self.dw)
-          py = self.ntrp(y,hi,lo,0,self.dh)
-          dest.append([px,py])
         # check one more time
-        if not self.drawing:
-          self.data = dest
+        if not self.drawing and self.trace_is_due():
+          self.set_trace(wfdest,lo,hi)
           self.update()
-  
+          
+  # the trace is redrawn at 'trace_rate' per second,
+  # or for every frame if 0
+  def trace_is_due(self):
+    rate = self.config['trace_rate']
+    if rate <= 0:
+      return True
+    now = time.time()
+    if now < self.trace_due:
+      return False
+    period = 1.0 / rate
+    self.trace_due = max(self.trace_due,now - period) + period
+    return True
+          
+  # screen coordinates for all points at once,
+  # written in place into the polygon's memory.
+  # with more bins than pixel columns, each column is
+  # drawn as its min/max envelope, so the point count
+  # follows the widget width and narrow peaks survive
+  def set_trace(self,values,lo,hi):
+    sz = len(values)
+    cols = int(self.dw)
+    lod = cols > 0 and sz > 2 * cols
+    key = (sz,cols,lod)
+    if self.trace_key != key:
+      n = (sz,2 * cols)[lod]
+      self.polygon = QtGui.QPolygonF(n)
+      ptr = self.polygon.data()
+      ptr.setsize(n * 2 * np.dtype(np.float64).itemsize)
+      self.trace = np.frombuffer(ptr,np.float64).reshape(n,2)
+      if lod:
+        # first bin of each pixel column
+        self.lod_edges = (np.arange(cols) * sz) // cols
+        self.trace[:,0] = np.repeat(np.arange(cols),2) * (float(self.dw) / cols)
+      else:
+        self.trace[:,0] = np.arange(sz) * (float(self.dw) / sz)
+      self.trace_key = key
+    y = self.trace[:,1]
+    if lod:
+      np.maximum.reduceat(values,self.lod_edges,out=y[0::2])
+      np.minimum.reduceat(values,self.lod_edges,out=y[1::2])
+      np.subtract(y,hi,out=y)
+    else:
+      np.subtract(values,hi,out=y)
+    np.multiply(y,float(self.dh)/(lo-hi),out=y)
+    
   # x must be normalized for these to work
   def zoom_scale(self,x):
     return x  * (self.mpb-self.mpa) + self.mpa
     
   def zoom_inv_scale(self,x):
     return (self.mpa - x)/(self.mpa  - self.mpb)
+    
+  # frequency at normalized position x across the displayed
+  # slice, the spectrum is centered on the LO, which may
+  # sit away from the dial frequency
+  def freq_at(self,x):
+    return self.cf + self.offset_f - self.srd2 + (self.view_a + x * (self.view_b - self.view_a)) * self.sr
+    
+  def position_of(self,f):
+    if self.sr == 0 or self.view_b == self.view_a:
+      return .5
+    return ((f - self.cf - self.offset_f + self.srd2) / self.sr - self.view_a) / (self.view_b - self.view_a)
   
   def get_ss(self):
     return self.ss
         
   def paintEvent(self,event):
     if self.isVisible():
+      t = time.time()
       self.drawing = True
       self.acquire_essential()
+      key = (self.dw,self.dh,self.cf,self.offset_f,self.srd2,self.view_a,self.view_b,self.config['dbscale_lo'],self.config['dbscale_hi'])
+      if self.overlay_key != key:
+        self.draw_overlay()
+        self.overlay_key = key
       qp = QPainter(self)
-      qp.fillRect(0, 0, self.width(), self.height(),self.black_color)
+      qp.drawPixmap(0,0,self.overlay)
       qp.setFont(self.monospace_font)
-      # vertical line at center frequency
-      qp.setPen(self.disp_vline_color)
-      xp = self.dw * self.zoom_inv_scale(.5)
-      qp.drawLine(xp,16,xp,self.dh-40)
       # data
-      if self.data:
+      if self.polygon != None:
         qp.setPen(self.disp_trace_color)
-        ox = None
-        oy = None
-        for item in self.data:
-          x,y = item
-          if ox != None:
-            qp.drawLine(ox,oy,x,y)
-          ox = x
-          oy = y
-      steps = 10
-      # horizontal frequency scale
+        qp.drawPolyline(self.polygon)
       qp.setPen(self.disp_text_color)
-      for n in range(1,steps):
-        nn = self.zoom_scale((float(n)/steps))
-        x = self.ntrp(n,0,steps,0,self.dw)
-        f = self.ntrp(nn,0,1,self.cf-self.srd2,self.cf+self.srd2)
-        # a way to limit the number of displayed digits
-        # based on the size of the frequency number
-        ff = (f,0)[f < 0]
-        qs = 3-int(math.log10(1+ff/1e6)+.5)
-        qs = (qs,0)[qs < 0]
-        sf = "%%.%df" % qs
-        s = sf % (f/1e6)
-        ssz = len(s) * self.dw/110
-        qp.drawText(x-ssz,self.dh-16,s)
-      # db scale
-      step = int(self.dh/10.0)
-      for y in range(step,self.dh-step,step):
-        db = self.ntrp(y,self.dh,0,self.config['dbscale_lo'],self.config['dbscale_hi'])
-        s = "%4d" % db
-        qp.drawText(4,y,s)
       # if the mouse is over the widget,
       # draw information label
       if self.mp != None:
-        n = self.zoom_scale(self.mousex/self.dw)
-        f = self.ntrp(n,0,1,self.cf-self.srd2,self.cf+self.srd2)
+        f = self.freq_at(self.mousex/self.dw)
         #qp.setPen(QtGui.QColor(128,128,255))
         s = "%.3f MHz" % (f/1e6)
         qp.drawText(self.mp.x(),self.mp.y()-24,s)
         s = "%.1f db" % (self.db)
         qp.drawText(self.mp.x(),self.mp.y()-4,s) 
       self.drawing = False
+      ms = (time.time() - t) * 1000
+      self.paint_ms += (ms-self.paint_ms) * self.integ_constant
+      
+  def static_text(self,s):
+    if s not in self.static_texts:
+      if len(self.static_texts) > 256:
+        self.static_texts.clear()
+      self.static_texts[s] = QStaticText(s)
+    return self.static_texts[s]
+    
+  # draws text with its baseline at y, as drawText does
+  def draw_label(self,qp,x,y,s):
+    qp.drawStaticText(QtCore.QPointF(x,y - qp.fontMetrics().ascent()),self.static_text(s))
+    
+  def draw_overlay(self):
+    self.overlay = QPixmap(max(1,self.dw),max(1,self.dh))
+    qp = QPainter(self.overlay)
+    qp.fillRect(0, 0, self.dw, self.dh,self.black_color)
+    qp.setFont(self.monospace_font)
+    # vertical line at center frequency
+    qp.setPen(self.disp_vline_color)
+    xp = self.dw * self.position_of(self.cf)
+    qp.drawLine(QtCore.QLineF(xp,16,xp,self.dh-40))
+    steps = 10
+    # horizontal frequency scale
+    qp.setPen(self.disp_text_color)
+    for n in range(1,steps):
+      x = self.ntrp(n,0,steps,0,self.dw)
+      f = self.freq_at(float(n)/steps)
+      # a way to limit the number of displayed digits
+      # based on the size of the frequency number
+      ff = (f,0)[f < 0]
+      qs = 3-int(math.log10(1+ff/1e6)+.5)
+      qs = (qs,0)[qs < 0]
+      sf = "%%.%df" % qs
+      s = sf % (f/1e6)
+      ssz = len(s) * self.dw/110
+      self.draw_label(qp,x-ssz,self.dh-16,s)
+    # db scale
+    step = int(self.dh/10.0)
+    if step > 0:
+      for y in range(step,self.dh-step,step):
+        db = self.ntrp(y,self.dh,0,self.config['dbscale_lo'],self.config['dbscale_hi'])
+        s = "%4d" % db
+        self.draw_label(qp,4,y,s)
+    qp.end()
+      
+  def timing_report(self):
+    n = self.polygon.size() if self.polygon is not None else 0
+    return "Spectrum paint %.2f ms/frame, %d points" % (self.paint_ms,n)
     
\ No newline at end of file
@@ -32,6 +32,18 @@ from PyQt5 import Qt
 from PyQt5 import QtCore,QtGui
 from PyQt5.QtWidgets import QWidget
 from PyQt5.QtCore import QEvent
+from PyQt5.QtGui import QColor,QPainter
+
+# each digit paints its own label, so a value or shade
+# change is a repaint of that label only, never a
+# stylesheet re-polish. Qt merges repeated update()
+# calls, so a fast retune paints once per frame
+
+bright_color = QColor('#00c000')
+dark_color = QColor('#003000')
+hover_color = QColor('#00ff00')
+background_color = QColor('black')
+hover_background_color = QColor('#404040')
 
 class FreqDigit(QWidget):
   def __init__(self,s,parent,lbl):
@@ -44,11 +56,24 @@ class FreqDigit(QWidget):
       self.value = int(s)
     except:
       self.value = 0
+    # the state last painted or scheduled for painting
+    self.shown = None
+    self.lbl.setText("%d" % self.value)
+    self.lbl.setToolTip("Right-click to clear lesser digits")
     self.lbl.installEventFilter(self)
   
   def eventFilter(self, source, evt):
     t = evt.type()
-    if t == QEvent.Wheel:
+    if t == QEvent.Paint:
+      self.paint()
+      return True
+    elif t == QEvent.Enter:
+      self.mouseover = True
+      self.reset_color()
+    elif t == QEvent.Leave:
+      self.mouseover = False
+      self.reset_color()
+    elif t == QEvent.Wheel:
       self.mouse_scroll_event(evt)
       return True
     elif t == QEvent.ContextMenu:
@@ -60,10 +85,23 @@ class FreqDigit(QWidget):
   def event_box(self):
     return self.eventbox
     
+  def state(self):
+    return (self.value,self.zero,self.mouseover)
+    
+  def paint(self):
+    self.shown = self.state()
+    qp = QPainter(self.lbl)
+    if self.mouseover:
+      qp.fillRect(self.lbl.rect(),hover_background_color)
+      qp.setPen(hover_color)
+    else:
+      qp.fillRect(self.lbl.rect(),background_color)
+      qp.setPen((bright_color,dark_color)[self.zero])
+    qp.setFont(self.lbl.font())
+    qp.drawText(self.lbl.rect(),QtCore.Qt.AlignCenter,"%d" % self.value)
+    
   def set_value(self,n):
     self.value = n % 10
-    self.lbl.setText("%d" % self.value)
-    self.lbl.setToolTip("Right-click to clear lesser digits")
     self.reset_color()
   def mouse_enter(self,evt,data):  
     self.mouseover = True
@@ -71,12 +109,12 @@ class FreqDigit(QWidget):
   def mouse_exit(self,evt,data):
     self.mouseover = False
     self.reset_color()
+  # schedules a repaint only if something visible changed
   def reset_color(self):
-    if self.zero:
-      self.lbl.setProperty('accessibleName' , 'FreqDigitDark')
-    else:
-      self.lbl.setProperty('accessibleName' , 'FreqDigit')
-    self.lbl.setStyle(self.lbl.style())
+    state = self.state()
+    if state != self.shown:
+      self.shown = state
+      self.lbl.update()
     
   def mouse_scroll_event(self,evt):
     if evt.angleDelta().y() > 0:
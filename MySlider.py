@@ -33,12 +33,16 @@ from PyQt5 import QtCore,QtGui
 from PyQt5.QtWidgets import QWidget
 from PyQt5.QtCore import QEvent
 
+import Debounce
+
 class Slider(QWidget):
-  def __init__(self,config,obj,function,config_name,a,b,maxv = 200):
+  def __init__(self,config,obj,function,config_name,a,b,maxv = 200,interval = 0):
     QWidget.__init__(self)
     self.config = config
     self.obj = obj
     self.function = function
+    # interval is the minimum ms between calls to function
+    self.send = Debounce.Debouncer(function,interval)
     self.config_name = config_name
     self.a = a
     self.b = b
@@ -65,8 +69,8 @@ class Slider(QWidget):
       v = (-5,5)[evt.angleDelta().y() > 0]
       pos = self.obj.value() + v
       pos = self.limit_range(pos)
+      # valueChanged updates config
       self.obj.setValue(pos)
-      self.config[self.config_name] = pos
       return True
     return False
   
@@ -90,7 +94,7 @@ class Slider(QWidget):
   def set_value(self,pos = None):
     self.process_pos(pos)
     #print("new slider value: %.2f" % self.result)
-    self.function(self.result,self.gain_name)
+    self.send(self.result,self.gain_name)
     
   def ntrp(self,x,xa,xb,ya,yb):
     return (x-xa) * (yb-ya) / (xb-xa) + ya
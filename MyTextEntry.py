@@ -35,13 +35,17 @@ from PyQt5.QtWidgets import QWidget
 from PyQt5.QtCore import QEvent
 #from PyQt5.QtGui #import ContextMenu
 
+import Debounce
+
 class TextEntry(QWidget):
-  def __init__(self,main,obj,function,config_name,minv,maxv,string_entry = False):
+  def __init__(self,main,obj,function,config_name,minv,maxv,string_entry = False,interval = 0):
     QWidget.__init__(self)
     self.obj = obj
     self.obj.setAlignment(QtCore.Qt.AlignRight)
     self.main = main
     self.function = function
+    # interval is the minimum ms between calls to function
+    self.send = Debounce.Debouncer(function,interval)
     self.config_name = config_name
     self.minv = int(minv)
     self.maxv = int(maxv)
@@ -100,7 +104,7 @@ class TextEntry(QWidget):
         
   def set_value(self,value = None):
     self.process(value)
-    self.function(self.value)
+    self.send(self.value)
     
   def get_value(self,value = None):
     self.process(value)
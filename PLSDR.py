@@ -48,6 +48,9 @@ import MyCheckbox
 import MyButtonGroup
 import Waterfall
 import OdsConverter
+import TapCache
+import ChannelFilter
+import ParamStore
    
 class PLSDR(QMainWindow, Ui_MainWindow):
   def __init__(self,app):
@@ -94,13 +97,15 @@ class PLSDR(QMainWindow, Ui_MainWindow):
     self.app_icon.addFile('icon/app_icon_256x256.png', QtCore.QSize(256,256))
     app.setWindowIcon(self.app_icon)
     app.aboutToQuit.connect(self.app_quit)
-    self.graphic_data = None
     self.config = self.get_default_config()
     self.full_rebuild_flag = True
     self.running = False
     self.enabled = False
     self.upconvert_state_control = None
+    # radio parameters for widgets that follow them
+    self.params = ParamStore.ParamStore()
     self.radio = Radio.Radio(self)
+    self.fft_widget = None
     self.meta_style_sheet = """
     QLabel[accessibleName=FreqDigit] {
       color:#00c000;
@@ -108,20 +113,6 @@ class PLSDR(QMainWindow, Ui_MainWindow):
       background:black;
       padding:0;
     }
-    QLabel[accessibleName=FreqDigitDark] {
-      color:#003000;
-      font-size:24pt;
-      background:black;
-      padding:0;
-    }
-    QLabel[accessibleName=FreqDigit]:hover {
-      color:#00ff00;
-      background:#404040;
-    }
-    QLabel[accessibleName=FreqDigitDark]:hover {
-      color:#00ff00;
-      background:#404040;
-    }
     QWidget[objectName=digit_widget] {
       background:black;
     }
@@ -194,10 +185,12 @@ class PLSDR(QMainWindow, Ui_MainWindow):
     
     self.if_bw_buttongroup_control = MyButtonGroup.ButtonGroup(self.config,self.if_bw_button_group,self.set_bw_mode,'bw_mode',self.bw_buttonlist)
     
-    self.gain_control_a = MySlider.Slider(self.config,self.gain_slider_a,self.set_named_gain,'gain_a',0,50)
-    self.gain_control_b = MySlider.Slider(self.config,self.gain_slider_b,self.set_named_gain,'gain_b',0,50)
-    self.gain_control_c = MySlider.Slider(self.config,self.gain_slider_c,self.set_named_gain,'gain_c',0,50)
-    self.gain_control_d = MySlider.Slider(self.config,self.gain_slider_d,self.set_named_gain,'gain_d',0,50)
+    # intervals are the minimum ms between calls into the radio,
+    # for controls that reach the hardware or rebuild the flowgraph
+    self.gain_control_a = MySlider.Slider(self.config,self.gain_slider_a,self.set_named_gain,'gain_a',0,50,interval=100)
+    self.gain_control_b = MySlider.Slider(self.config,self.gain_slider_b,self.set_named_gain,'gain_b',0,50,interval=100)
+    self.gain_control_c = MySlider.Slider(self.config,self.gain_slider_c,self.set_named_gain,'gain_c',0,50,interval=100)
+    self.gain_control_d = MySlider.Slider(self.config,self.gain_slider_d,self.set_named_gain,'gain_d',0,50,interval=100)
     
     self.af_gain_control = MySlider.Slider(self.config,self.af_gain_slider,self.set_af_gain,'af_gain',0,1,400)
     self.average_control = MySlider.Slider(self.config,self.averaging_slider,self.set_average,'average',1,.01)
@@ -224,15 +217,15 @@ class PLSDR(QMainWindow, Ui_MainWindow):
     
     self.sample_rate_control = MyCombo.Combo(self,self.config,self.sample_rate_combo,self.critical_change,'sample_rate')
     
-    self.audio_rate_control = MyTextEntry.TextEntry(self,self.audio_rate_text,self.critical_change,'audio_rate',1e3,60e3)
+    self.audio_rate_control = MyTextEntry.TextEntry(self,self.audio_rate_text,self.critical_change,'audio_rate',1e3,60e3,interval=500)
     
-    self.cw_base_control = MyTextEntry.TextEntry(self,self.cw_base_text,self.critical_change,'cw_base',1e2,3e3)
+    self.cw_base_control = MyTextEntry.TextEntry(self,self.cw_base_text,self.critical_change,'cw_base',1e2,3e3,interval=500)
     
     self.audio_device_control = MyTextEntry.TextEntry(self,self.audio_device_text,self.critical_change,'audio_device',0,0,True)
     
-    self.corr_ppm_control = MyTextEntry.TextEntry(self,self.corr_ppm_text,self.set_corr_ppm,'corr_ppm',-100,100)
+    self.corr_ppm_control = MyTextEntry.TextEntry(self,self.corr_ppm_text,self.set_corr_ppm,'corr_ppm',-100,100,interval=100)
     
-    self.corr_ppm_upc_control = MyTextEntry.TextEntry(self,self.corr_ppm_upc_text,self.set_corr_ppm_upc,'corr_ppm_upc',-100,100)
+    self.corr_ppm_upc_control = MyTextEntry.TextEntry(self,self.corr_ppm_upc_text,self.set_corr_ppm_upc,'corr_ppm_upc',-100,100,interval=100)
     
     self.upconvert_state_control = MyCheckbox.Checkbox(self,self.upconversion_checkbox,self.use_upconversion,'upconvert_state')
     
@@ -255,9 +248,18 @@ class PLSDR(QMainWindow, Ui_MainWindow):
   def first_read_config(self):
     self.setup_help()
     self.read_config()
+    self.params.set('freq',self.config['freq'])
     self.waterfall_widget = Waterfall.WaterfallWidget(self,self.config,self.waterfall_layout)
     self.fft_widget = FFTDisp.FFTDispWidget(self,self.config,self.fft_disp_layout)
     self.enabled = True
+    # monitored channels open and close on their own
+    if self.config['monitor_channels']:
+      self.monitor_timer = QtCore.QTimer()
+      self.monitor_timer.timeout.connect(self.update_status)
+      self.monitor_timer.start(500)
+    if '--leak-check' in sys.argv:
+      # let the first radio build finish
+      QtCore.QTimer.singleShot(2000, self.leak_check)
   
   def setup_help(self):
     # load help document into help browser
@@ -323,8 +325,19 @@ class PLSDR(QMainWindow, Ui_MainWindow):
       'dbscale_lo' : -140,
       'dbscale_hi' : 10,
       'hilbert_taps' : 128,
+      'ssb_engine' : 'filter',
+      'front_end_xlate' : True,
+      'monitor_channels' : False,
+      'monitor_spacing' : 25000,
+      'monitor_max_channels' : 16,
+      'tap_cache_size' : 64,
+      'device_cache_days' : 30,
+      'fft_filter_crossover' : 64,
       'fft_zoom' : 0,
       'framerate' : 6,
+      'tune_guard' : 0.1,
+      'tune_rate' : 50,
+      'spectrum_merge' : 'max',
       'selected_device' : 0,
       'offset_state' : False,
       'offset_freq' : -10000,
@@ -336,6 +349,16 @@ class PLSDR(QMainWindow, Ui_MainWindow):
       'dc_offset' : False,
       'iq_balance' : False,
       'waterfall_bias' : 150,
+      'waterfall_history' : 4096,
+      'waterfall_columns' : 1024,
+      'waterfall_format' : 'float16',
+      'waterfall_rate' : 0,
+      'waterfall_merge' : 'max',
+      'trace_rate' : 0,
+      'waterfall_archive' : False,
+      'archive_columns' : 1024,
+      'archive_file_mb' : 256,
+      'archive_files' : 8,
       'disp_trace_color' : '#ffff00',
       'disp_text_color' : '#80c0ff',
       'disp_vline_color' : '#c00000',
@@ -352,6 +375,13 @@ class PLSDR(QMainWindow, Ui_MainWindow):
       for key in self.config.keys():
         if key in oldconfig:
           self.config[key] = oldconfig[key]
+    # designed filter taps from earlier sessions
+    TapCache.shared.set_capacity(self.config['tap_cache_size'])
+    TapCache.shared.load(os.path.join(self.config_path,'tap_cache.npz'))
+    # device capabilities from earlier sessions
+    self.radio.capabilities.set_max_age(self.config['device_cache_days'])
+    self.radio.capabilities.load(os.path.join(self.config_path,'device_cache.txt'))
+    ChannelFilter.set_crossover(self.config['fft_filter_crossover'])
     # set interface values from configuration
     self.assign_freq(self.config['freq'])
     self.update_radio_values()
@@ -474,25 +504,44 @@ class PLSDR(QMainWindow, Ui_MainWindow):
     return False
   
   def update_status(self):
-    if not self.radio.device_found:
+    if self.radio.probing:
+      s = "%s | Probing device ..." % self.device_control.get_value()
+    elif not self.radio.device_found:
       s = "No radio device detected"
     else:
       if self.running:
-        s = "%s | %s | %.6f MHz | Upconvert:%s | Offset:%s" % \
+        s = "%s | %s | %.6f MHz | Upconvert:%s | Offset:%s | DSP:%s" % \
         (
           self.device_control.get_value(),
           self.mode_control.get_value(),
           self.config['freq']/1e6,
           self.upconvert_state_control.get_value_as_letter(),
           self.offset_state_control.get_value_as_letter(),
+          self.radio.decimation_summary(),
           )  
+        if self.radio.monitor != None:
+          s += " | Monitor:%s" % self.radio.monitor_summary()
       else:
         s = "%s | %s | Stopped" % (
           self.device_control.get_value(),
           self.mode_control.get_value(),
           )
     self.status_label.setText(s)
-      
+    tips = [
+      self.radio.decimation_report(),
+      self.radio.mode_switch_report(),
+      self.radio.monitor_report(),
+      self.radio.device_report(),
+      self.radio.capabilities_report(),
+      self.radio.frame_report(),
+      self.radio.archive_report(),
+      self.radio.memory_report(),
+      TapCache.shared.stats(),
+    ]
+    if self.fft_widget != None:
+      tips.append(self.fft_widget.timing_report())
+    self.status_label.setToolTip('\n'.join([t for t in tips if len(t) > 0]))
+
   def update_freq(self,f = None):
     if self.enabled:
       self.radio.test_set_cw_offset()
@@ -503,13 +552,15 @@ class PLSDR(QMainWindow, Ui_MainWindow):
       upconvert_offset = 0
       if self.test_upconvert_mode():
         upconvert_offset = self.upconvert_freq_control.get_value()
-      mf = self.config['freq']+upconvert_offset+self.radio.compute_offset_f()
-      if self.radio.osmosdr_source != None:
-        #print("assigned freq: %f = %d" % (mf,int(mf)))
-        self.radio.osmosdr_source.set_center_freq(int(mf), 0)
-        self.radio.osmosdr_source.set_freq_corr(self.acquire_corr_ppm(), 0)
-      self.radio.update_freq_xlating_fir_filter()
+      self.radio.tune(self.config['freq']+upconvert_offset,self.acquire_corr_ppm())
+      self.params.set('freq',self.config['freq'])
+      self.lo_changed()
       self.update_status()
+      
+  # also called through Radio.lo_tuned after the hardware LO moves
+  def lo_changed(self):
+    self.params.set('offset',self.radio.lo_offset())
+    self.radio.retune_monitor(self.config)
 
   def assign_freq(self,f = None):
     if f == None:
@@ -534,8 +585,12 @@ class PLSDR(QMainWindow, Ui_MainWindow):
     self.run_stop_button.setChecked(start)
     if start and self.radio.error == False:
       self.update_default_freq()
-      self.radio.start()
+      # on the device thread, once the sample rate and
+      # frequency queued ahead of it have been applied
+      self.radio.device.submit('start',self.radio.start)
     else:
+      # a start still queued must not follow the stop
+      self.radio.device.withdraw('start')
       self.radio.stop()
       self.radio.wait()
       self.radio.disconnect_all()
@@ -549,9 +604,6 @@ class PLSDR(QMainWindow, Ui_MainWindow):
     if self.running:
       self.start_process(False)
       self.radio.cw_offset = 0
-      if self.full_rebuild_flag:
-        self.radio = Radio.Radio(self)
-        self.full_rebuild_flag = False  
       self.update_freq()
       self.update_radio_values()
       self.radio.initialize_radio(self.config)
@@ -563,6 +615,10 @@ class PLSDR(QMainWindow, Ui_MainWindow):
  
 
   def change_modes(self,value = None,name = None):
+    if self.running and not self.full_rebuild_flag and self.radio.can_switch_mode():
+      if self.radio.switch_mode(self.config):
+        self.update_freq()
+        return
     self.run_stop()
     
   def critical_change(self,value,name = None):
@@ -570,6 +626,20 @@ class PLSDR(QMainWindow, Ui_MainWindow):
       self.full_rebuild_flag = True
       self.run_stop()
     
+  # rebuilds the radio repeatedly and prints resident memory
+  # after each cycle, the figures should level off, not climb
+  def leak_check(self,cycles = 20):
+    sizes = [[64,4096][n % 2] for n in range(cycles)]
+    # the user's FFT size, config is saved on quit
+    saved = self.fft_size_control.get_index()
+    for n,size in enumerate(sizes):
+      self.radio.invalidate()
+      self.fft_size_control.set_value(self.fft_sizes.index(str(size)))
+      print("rebuild %2d: %d kB" % (n+1,Radio.resident_memory_kb()))
+    growth = self.radio.rebuild_memory[-1] - self.radio.rebuild_memory[0]
+    print("growth over the last %d rebuilds: %d kB" % (len(self.radio.rebuild_memory),growth))
+    self.fft_size_control.set_value(saved)
+    
   def change_framerate(self,value):
     self.run_stop()
   
@@ -590,6 +660,15 @@ class PLSDR(QMainWindow, Ui_MainWindow):
       #self.assign_freq()
 
 
+  # frequency list entries as (Hz, mode, label)
+  # for simultaneous monitoring
+  def monitor_channel_list(self):
+    result = []
+    for record in self.accessible_list:
+      label = ' '.join([str(record[n]) for n in range(len(record)) if n not in (self.freq_field,self.mode_field)])
+      result.append((record[self.freq_field],record[self.mode_field].upper(),label.strip()))
+    return result
+
   def message_dialog(self,title,message):
     mb = QMessageBox (QMessageBox.Warning,title,message,QMessageBox.Ok)
     mb.exec_()
@@ -666,12 +745,12 @@ class PLSDR(QMainWindow, Ui_MainWindow):
           self.model.appendRow(qrecord)
     
   def draw_fft_disp(self):
-    if self.graphic_data != None:
-      #sya = self.config['dbscale_lo']
-      #syb = self.config['dbscale_hi']
-      # note Y axis reversal
-      self.fft_widget.accept_data(self.graphic_data)
-      self.graphic_data = None
+    sink = self.radio.fft_vector_sink
+    if sink != None:
+      data = sink.read()
+      if data is not None:
+        self.fft_widget.accept_data(data)
+        sink.release()
       
   def configure_device_combo(self):
     dev_name_list = sorted(self.device_dict.keys())
@@ -683,7 +762,7 @@ class PLSDR(QMainWindow, Ui_MainWindow):
     if self.radio.osmosdr_source != None and string != None:
       bw = float(string)
       #print("set bandwidth: %d" % bw)
-      self.radio.osmosdr_source.set_bandwidth(bw, 0)
+      self.radio.device.submit('bandwidth',bw)
       
   def set_average(self,result,name = None):
     if self.radio.logpwrfft != None:
@@ -699,23 +778,18 @@ class PLSDR(QMainWindow, Ui_MainWindow):
   def set_named_gain(self,result,name = None):
     if self.radio.osmosdr_source != None and name != None:
       #print("result: %.2f, name: %s" % (result,name))
-      self.radio.osmosdr_source.set_gain(result,name,0)
+      self.radio.device.submit('gain',result,name)
       
   def set_squelch(self,result,name):
-    if self.radio.analog_pwr_squelch != None:
-      self.radio.analog_pwr_squelch.set_threshold(result)
-    if self.radio.analog_pwr_squelch_ssb != None:
-      self.radio.analog_pwr_squelch_ssb.set_threshold(result)
+    self.radio.set_squelch(result)
 
   def set_corr_ppm(self,result):
     if not self.test_upconvert_mode():
-      if self.radio.osmosdr_source != None:
-        self.radio.osmosdr_source.set_freq_corr(result,0)
+      self.radio.set_freq_corr(result)
       
   def set_corr_ppm_upc(self,result):
     if self.test_upconvert_mode():
-      if self.radio.osmosdr_source != None:
-        self.radio.osmosdr_source.set_freq_corr(result,0)
+      self.radio.set_freq_corr(result)
       
   def set_cw_base(self,result):
     self.cw_base = result
@@ -737,41 +811,35 @@ class PLSDR(QMainWindow, Ui_MainWindow):
         agc_max_gain = 65536
       elif mode == self.AGC_HW:
         hw_mode = True
-      self.radio.osmosdr_source.set_gain_mode(hw_mode,0)
-      if self.radio.analog_agc_cc != None:
-        #print("setting AGC mode: %d" % mode)
-        for inst in (self.radio.analog_agc_cc,self.radio.analog_agc_ff):
-          inst.set_reference(agc_reference)
-          inst.set_gain(agc_gain)
-          inst.set_max_gain(agc_max_gain)
-          inst.set_attack_rate(agc_attack_rate)
-          inst.set_decay_rate(agc_decay_rate)
+      self.radio.device.submit('gain_mode',hw_mode)
+      #print("setting AGC mode: %d" % mode)
+      self.radio.set_agc(agc_reference,agc_gain,agc_max_gain,agc_attack_rate,agc_decay_rate)
 
   def set_bw_mode(self,result):
     self.radio.rebuild_filters(self.config,result)
     
   def set_hardware_agc(self,result):
     if self.radio.osmosdr_source != None:
-      self.radio.osmosdr_source.set_gain_mode(result,0)
+      self.radio.device.submit('gain_mode',result)
   
   def set_dc_offset(self,result):
     if self.radio.osmosdr_source != None:
       dco = (0,2)[result]
-      self.radio.osmosdr_source.set_dc_offset_mode(dco,0)
+      self.radio.device.submit('dc_offset_mode',dco)
       
   def set_iq_balance(self,result):
     if self.radio.osmosdr_source != None:
       iqb = (0,2)[result]
-      self.radio.osmosdr_source.set_iq_balance_mode(iqb,0)
+      self.radio.device.submit('iq_balance_mode',iqb)
   
   def use_offset(self,result):
     if self.radio != None:
-      self.radio.create_update_freq_xlating_fir_filter()
+      self.radio.update_offset_values()
       self.update_freq()
       
   def update_offset_freq(self,result):
     if self.radio != None:
-      self.radio.create_update_freq_xlating_fir_filter()
+      self.radio.update_offset_values()
       self.update_freq()
     
   def use_upconversion(self,result):
@@ -797,6 +865,9 @@ class PLSDR(QMainWindow, Ui_MainWindow):
     self.enabled = False
     self.start_process(False)
     self.write_config(self.config)
+    TapCache.shared.save()
+    if self.radio.recorder != None:
+      self.radio.recorder.close()
     Qt.QApplication.quit()   
 
 if __name__ == "__main__":
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#**************************************************************************
+#   Copyright (C) 2018, Paul Lutus                                        *
+#                                                                         *
+#   This program is free software; you can redistribute it and/or modify  *
+#   it under the terms of the GNU General Public License as published by  *
+#   the Free Software Foundation; either version 2 of the License, or     *
+#   (at your option) any later version.                                   *
+#                                                                         *
+#   This program is distributed in the hope that it will be useful,       *
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+#   GNU General Public License for more details.                          *
+#                                                                         *
+#   You should have received a copy of the GNU General Public License     *
+#   along with this program; if not, write to the                         *
+#   Free Software Foundation, Inc.,                                       *
+#   59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.             *
+#**************************************************************************
+
+# a small observable store for radio parameters. producers
+# publish values as they change and widgets subscribe,
+# so reading a parameter never touches another widget
+
+class ParamStore():
+  def __init__(self):
+    self.values = {}
+    self.observers = {}
+
+  def get(self,name,default = None):
+    return self.values.get(name,default)
+
+  # observers are called only when the value changes
+  def set(self,name,value):
+    if name in self.values and self.values[name] == value:
+      return
+    self.values[name] = value
+    for callback in self.observers.get(name,[]):
+      callback(value)
+
+  # a new subscriber receives the current value, if any
+  def subscribe(self,name,callback):
+    self.observers.setdefault(name,[]).append(callback)
+    if name in self.values:
+      callback(self.values[name])
@@ -34,25 +34,46 @@ from PyQt5 import QtCore
 from PyQt5 import QtGui
 from PyQt5.QtWidgets import QWidget
 
-from gnuradio import analog
 from gnuradio import audio
 from gnuradio import blocks
-from gnuradio import filter
 from gnuradio import gr
-from gnuradio.filter import firdes
 from gnuradio.fft import logpwrfft
 
 import sip
 
+import Channelizer
+import Decimator
+import Demodulators
+import DeviceCapabilities
+import DeviceControl
+import WaterfallArchive
+
+# current resident set size in kB, or 0 if it can't be read
+def resident_memory_kb():
+  try:
+    with open('/proc/self/statm') as f:
+      pages = int(f.read().split()[1])
+    return pages * os.sysconf('SC_PAGE_SIZE') // 1024
+  except Exception:
+    return 0
+
 class DrawGraphics(QtCore.QObject):
     draw = QtCore.pyqtSignal() 
 
 # a convenience class to acquire data from Gnuradio
-    
+# frames are written in place into one of two preallocated
+# buffers, the GUI reads the other one as a NumPy view.
+# frames arriving while the GUI is busy are folded into
+# an accumulator by policy 'max', 'mean' or 'latest', so
+# each delivered frame summarizes everything since the last
+# frame the GUI consumed
+
 class MyVectorSink(gr.sync_block):
-  def __init__(self,main,sz):
+  def __init__(self,main,sz,policy = 'max',recorder = None):
     self.main = main
     self.sz = sz
+    self.policy = policy
+    self.recorder = recorder
      
     gr.sync_block.__init__(
     self,
@@ -60,16 +81,75 @@ class MyVectorSink(gr.sync_block):
     in_sig = [(np.float32,self.sz)],
     out_sig = None,
     )
+    self.frames = np.zeros((2,sz),np.float32)
+    self.views = [self.frames[0],self.frames[1]]
+    # fftshift as an index rotation
+    self.shift = np.fft.fftshift(np.arange(sz))
+    # the newest frame, and the last one the GUI has finished with
+    self.seq = 0
+    self.consumed = 0
+    self.accum = np.zeros(sz,np.float32)
+    self.scratch = np.zeros(sz,np.float32)
+    # frames folded into the accumulator, not yet delivered
+    self.pending = 0
+    self.produced = 0
+    self.delivered = 0
+    self.merged = 0
     # event-related
     self.drawgr = DrawGraphics()
     self.drawgr.draw.connect(self.main.draw_fft_disp)
 
   def work(self, input_items, output_items):
-    if(self.main.graphic_data == None):
-      data = np.fft.fftshift(input_items)
-      self.main.graphic_data = data[0][0].tolist()
-      self.drawgr.draw.emit()
-    return len(input_items)
+    items = input_items[0]
+    if self.recorder != None:
+      self.recorder.append(np.take(items,self.shift,axis=1),self.main.radio.spectrum_center(),self.main.radio.sample_rate)
+    self.fold(items)
+    if self.consumed == self.seq:
+      self.deliver()
+    return len(items)
+    
+  def fold(self,items):
+    n = len(items)
+    self.produced += n
+    if self.policy == 'latest':
+      np.copyto(self.accum,items[-1])
+    elif self.policy == 'mean':
+      if self.pending == 0:
+        np.sum(items,axis=0,out=self.accum)
+      else:
+        np.sum(items,axis=0,out=self.scratch)
+        np.add(self.accum,self.scratch,out=self.accum)
+    else:
+      if self.pending == 0:
+        np.max(items,axis=0,out=self.accum)
+      else:
+        np.max(items,axis=0,out=self.scratch)
+        np.maximum(self.accum,self.scratch,out=self.accum)
+    self.pending += n
+    
+  def deliver(self):
+    if self.policy == 'mean' and self.pending > 1:
+      np.multiply(self.accum,1.0/self.pending,out=self.accum)
+    # the slot the GUI is not reading
+    np.take(self.accum,self.shift,out=self.views[(self.seq + 1) % 2],mode='clip')
+    self.merged += self.pending - 1
+    self.delivered += 1
+    self.pending = 0
+    self.seq += 1
+    self.drawgr.draw.emit()
+    
+  # the newest frame, or None if the GUI has already had it
+  def read(self):
+    if self.consumed == self.seq:
+      return None
+    return self.views[self.seq % 2]
+    
+  def release(self):
+    self.consumed = self.seq
+    
+  def report(self):
+    return "Spectrum frames (%s): %d produced, %d delivered, %d merged" % (
+      self.policy,self.produced,self.delivered,self.merged)
      
 class Radio(gr.top_block,QWidget):
   def __init__(self,main):
@@ -80,26 +160,53 @@ class Radio(gr.top_block,QWidget):
     self.cw_offset = 0
     self.blocks_multiply_const_volume = None
     self.logpwrfft = None
+    self.fft_vector_sink = None
+    # long-duration waterfall recording
+    self.recorder = None
     self.audio_sink = None
     self.osmosdr_source = None
-    self.analog_agc_cc = None
-    self.analog_pwr_squelch = None
-    self.analog_pwr_squelch_ssb = None
-    self.freq_xlating_fir_filter = None
-    self.low_pass_filter_am = None
-    self.low_pass_filter_fm = None
-    self.low_pass_filter_wfm = None
-    self.low_pass_filter_ssb = None
-    self.band_pass_filter_cw = None
+    self.demodulator = None
+    # simultaneous channels from the frequency list
+    self.monitor = None
+    self.audio_mixer = None
+    # built demodulators, kept alive across mode switches
+    self.demodulators = {}
+    # settings the current blocks were built with
+    self.built_config = None
+    # resident memory after each rebuild, for leak checks
+    self.rebuild_memory = []
+    # mode switch instrumentation
+    self.mode_switch_ms = None
+    self.source_open_count = 0
+    self.agc_params = None
+    self.squelch_level = None
+    self.decimation_plan_nrw = None
+    self.decimation_plan_wid = None
     self.cw_base = None
     self.mode = None
     self.sample_rate = None
     self.audio_rate = None
     self.gain_names = None
     self.device_found = False
+    # True while a new device's capabilities are being probed
+    self.probing = False
     self.currently_configured_device = None
     self.error = False
     #self.if_offset_f = 0
+    # the device frequency wanted at the dial, the LO
+    # last requested and the LO the hardware has reached
+    self.tune_freq = None
+    self.tune_ppm = None
+    self.lo_target = None
+    self.lo_freq = None
+    # runs the osmosdr setters off the GUI thread
+    self.device = DeviceControl.DeviceControl(self)
+    self.device.tuned.connect(self.lo_tuned)
+    # device capabilities, probed once and kept on disk
+    self.capabilities = DeviceCapabilities.CapabilityCache()
+    self.source_caps = None
+    self.probe_signal = DeviceCapabilities.ProbeSignal()
+    self.probe_signal.probed.connect(self.capabilities_probed,QtCore.Qt.QueuedConnection)
     
   def ntrp(self,x,xa,xb,ya,yb):
     return (x-xa) * (yb-ya) / (xb-xa) + ya
@@ -109,7 +216,7 @@ class Radio(gr.top_block,QWidget):
     self.if_sample_rate = int(240e3)
     self.ssb_hi = 3000
     self.ssb_lo = 100
-    self.hilbert_taps_ssb = 128
+    self.hilbert_taps_ssb = config['hilbert_taps']
     self.cw_base = config['cw_base']
     self.cw_lo = -self.cw_base/2
     self.cw_hi = self.cw_base/2
@@ -125,6 +232,11 @@ class Radio(gr.top_block,QWidget):
     self.device_name = self.main.device_control.get_value()
     self.device_driver_name = self.main.device_dict[self.device_name]
     self.configure_source_controls()
+    # the hardware state is unknown after a rebuild
+    self.lo_target = None
+    self.lo_freq = None
+    self.tune_ppm = None
+    self.device.set_rate('freq',config['tune_rate'])
     
         
     #if self.main.full_rebuild_flag or self.error:
@@ -150,16 +262,20 @@ class Radio(gr.top_block,QWidget):
         
   def change_antennas(self,value):
     if self.osmosdr_source != None:
-      self.osmosdr_source.set_antenna(value)
+      self.device.submit('antenna',value)
       #print("changed to antenna: %s" % value)
           
+  # the registered demodulator class for the selected mode
+  def demodulator_class(self):
+    if self.mode == None:
+      return None
+    return Demodulators.registry.get(self.main.mode_list[self.mode])
+          
   def test_set_cw_offset(self):
     offset = 0
-    if self.mode == self.main.MODE_CW_LSB or self.mode == self.main.MODE_CW_USB:
-      if self.mode == self.main.MODE_CW_LSB:
-        offset = -self.cw_base/2
-      else:
-        offset = self.cw_base/2
+    cls = self.demodulator_class()
+    if cls != None and self.cw_base != None:
+      offset = cls.cw_offset_sign * self.cw_base/2
     return offset
      
   def compute_offset_f(self,front_end = True):
@@ -171,104 +287,131 @@ class Radio(gr.top_block,QWidget):
       return -(self.fir_offset_f + self.cw_offset)
   
   def update_freq_xlating_fir_filter(self):
-    if self.freq_xlating_fir_filter != None:
-      f = self.compute_offset_f(False)
-      self.freq_xlating_fir_filter.set_center_freq(f)
-    
-  # changing between USB and LSB requires changing the sign of a multiplication term  
-  def create_usb_lsb_switch(self):
-    USB = self.mode == self.main.MODE_USB or self.mode == self.main.MODE_CW_USB
-    self.blocks_multiply_const_ssb = blocks.multiply_const_vff(((1,-1)[USB], ))
+    if self.demodulator != None:
+      self.demodulator.set_center_freq(self.xlate_freq())
+      
+  # the LO relative to the dial frequency
+  def lo_offset(self):
+    if self.lo_freq == None or self.tune_freq == None:
+      return self.compute_offset_f()
+    return self.lo_freq - self.tune_freq
+    
+  # the dial frequency at the center of the spectrum
+  def spectrum_center(self):
+    return self.main.config['freq'] + self.lo_offset()
+    
+  # the translating filter makes up the difference
+  # between the nominal LO and the actual one
+  def xlate_freq(self):
+    return self.compute_offset_f(False) + self.compute_offset_f() - self.lo_offset()
+    
+  def xlate_limit(self):
+    if self.demodulator == None:
+      return 0
+    return self.demodulator.xlate_range(self.main.config['tune_guard'])
+    
+  # freq is the device frequency for the dial, ppm the
+  # correction. the channel moves at once in software, the
+  # hardware LO follows on the tune thread, only when
+  # the channel would leave the guarded passband
+  def tune(self,freq,ppm):
+    self.tune_freq = freq
+    nominal = freq + self.compute_offset_f()
+    if self.lo_target == None or abs(nominal - self.lo_target) > self.xlate_limit():
+      self.lo_target = nominal
+      self.device.submit('freq',nominal)
+    if ppm != self.tune_ppm:
+      self.set_freq_corr(ppm)
+    self.update_freq_xlating_fir_filter()
+    
+  # on the GUI thread once the hardware LO has moved, the
+  # translating filter takes up the new difference
+  def lo_tuned(self,freq):
+    self.lo_freq = freq
+    self.update_freq_xlating_fir_filter()
+    self.main.lo_changed()
+    
+  def set_freq_corr(self,ppm):
+    self.tune_ppm = ppm
+    if self.osmosdr_source != None:
+      self.device.submit('freq_corr',ppm)
+    
+  def device_report(self):
+    return self.device.report()
 
-  def create_update_freq_xlating_fir_filter(self):
-    if self.sample_rate != None:
-      self.update_offset_values()
-      if self.mode == self.main.MODE_WFM:
-        rate = self.if_sample_rate
-      else:
-        rate = self.audio_rate
-        
-      fir_taps = firdes.complex_band_pass(1, rate, -rate/2, rate/2,rate/2)
-      if self.freq_xlating_fir_filter == None:
-        self.freq_xlating_fir_filter = filter.freq_xlating_fir_filter_ccc(1, (fir_taps), self.compute_offset_f(False), rate)
-      else:
-        self.freq_xlating_fir_filter.set_taps(fir_taps)
-        self.freq_xlating_fir_filter.set_center_freq(self.compute_offset_f(False))
+  def decimation_plan(self,wide):
+    if wide:
+      return self.decimation_plan_wid
+    return self.decimation_plan_nrw
+    
+  def current_decimation_plan(self):
+    cls = self.demodulator_class()
+    if cls == None:
+      return None
+    return self.decimation_plan(cls.wide)
   
   def rebuild_filters(self,config,value = None):
-    if self.cw_base == None:
+    if self.cw_base == None or self.demodulator == None:
       return
     if value == None:
       value = config['bw_mode']
+    self.demodulator.rebuild_filters(value)
+    
+  def set_squelch(self,level):
+    self.squelch_level = level
+    if self.demodulator != None:
+      self.demodulator.set_squelch(level)
+    if self.monitor != None:
+      self.monitor.set_squelch(level)
       
-    am_bw = (8000,3000,2000)[value]
-    fm_bw = (8000,6000,4000)[value]
-    wfm_bw = (60e3,40e3,20e3)[value]
-    ssb_bw = (5000,2400,1800)[value]
-    cw_bw = (self.cw_base*2/3,self.cw_base/2,self.cw_base/3)[value]
-    
-    am_taps = firdes.low_pass(
-      1, self.audio_rate, am_bw, 500, firdes.WIN_HAMMING, 6.76)
-    fm_taps = firdes.low_pass(
-      1, self.audio_rate, fm_bw, 500, firdes.WIN_HAMMING, 6.76)
-    wfm_taps = firdes.low_pass(
-      1, self.if_sample_rate, wfm_bw, 4e3, firdes.WIN_HAMMING, 6.76)
-    ssb_taps = firdes.low_pass(
-      1, self.audio_rate, ssb_bw, 100, firdes.WIN_HAMMING, 6.76)
-    #print("CW Base: %d - %d - %d" % (self.cw_base-cw_bw,self.cw_base + cw_bw,self.audio_rate))
-    cw_taps = firdes.band_pass(
-      1, self.audio_rate, self.cw_base-cw_bw,self.cw_base+cw_bw, 100, firdes.WIN_HAMMING, 6.76)
-    
-    if self.low_pass_filter_am == None:
-      self.low_pass_filter_am = filter.fir_filter_ccf(1, am_taps)
-    else:
-      self.low_pass_filter_am.set_taps(am_taps) 
-      
-    if self.low_pass_filter_fm == None:
-      self.low_pass_filter_fm = filter.fir_filter_ccf(1, fm_taps)
-    else:
-      self.low_pass_filter_fm.set_taps(fm_taps)
+  # arguments are reference, gain, max gain, attack rate, decay rate
+  def set_agc(self,*params):
+    self.agc_params = params
+    if self.demodulator != None:
+      self.demodulator.set_agc(*params)
       
-    if self.low_pass_filter_wfm == None:
-      self.low_pass_filter_wfm = filter.fir_filter_ccf(1, wfm_taps)
-    else:
-      self.low_pass_filter_wfm.set_taps(wfm_taps)
-      
-    if self.low_pass_filter_ssb == None:
-      self.low_pass_filter_ssb = filter.fir_filter_fff(1, ssb_taps)
-    else:
-      self.low_pass_filter_ssb.set_taps(ssb_taps)
-      
-    if self.band_pass_filter_cw == None:
-      self.band_pass_filter_cw = filter.fir_filter_fff(1, cw_taps)
-    else:
-      self.band_pass_filter_cw.set_taps(cw_taps)
-      
-  # calculate gcd using Euclid's algorithm
-  def gcd(self,a, b):
-    while b:
-        a, b = b, a%b
-    return a
-    
-  def compute_dec_interp(self,a,b):
-    a = int(a)
-    b = int(b)
-    gcd = self.gcd(a,b)
-    dec = a/gcd
-    interp = b/gcd
-    return dec,interp
+  def decimation_summary(self):
+    plan = self.current_decimation_plan()
+    if plan == None:
+      return ''
+    return plan.summary()
+    
+  def decimation_report(self):
+    s = []
+    for name,plan in (('NRW',self.decimation_plan_nrw),('WID',self.decimation_plan_wid)):
+      if plan != None:
+        s.append("%s %s" % (name,plan.describe()))
+    if self.demodulator != None:
+      s.append(self.demodulator.filter_report())
+    return '\n'.join(s)
     
   # reference at  https://github.com/osmocom/gr-osmosdr/blob/master/include/osmosdr/source.h
 
   def configure_source_controls(self):
+    opened = False
     if self.osmosdr_source == None or self.device_driver_name != self.currently_configured_device:
       self.osmosdr_source = osmosdr.source( args="numchan=1 %s" % self.device_driver_name)
+      self.source_open_count += 1
+      # commands queued for the previous device
+      self.device.reset()
       self.currently_configured_device = self.device_driver_name
+      # None until the first probe of this device finishes
+      self.source_caps = self.capabilities.lookup(self.device_driver_name)
+      opened = True
+    caps = self.source_caps
+    if caps == None:
+      self.show_probing()
+      if opened:
+        self.submit_probe()
+      return
+    self.probing = False
     
-    # this is required to allow a change in bandwidth
-    self.osmosdr_source.set_bandwidth(1)
+    # this is required to allow a change in bandwidth,
+    # queued as its own kind so the real bandwidth that
+    # follows can't merge into it
+    self.device.submit('bandwidth_reset',1)
     
-    self.gain_names = self.osmosdr_source.get_gain_names()
+    self.gain_names = caps['gain_names']
     if len(self.gain_names) == 0:
       # no device found
       self.main.run_stop_button.setEnabled(False)
@@ -280,11 +423,10 @@ class Radio(gr.top_block,QWidget):
       self.main.dc_offset_control.set_value()
       self.main.iq_balance_control.set_value()
       self.main.run_stop_button.setEnabled(True)
-      antennas = self.osmosdr_source.get_antennas()
-      self.main.antenna_control.set_content(antennas)
+      self.main.antenna_control.set_content(caps['antennas'])
       self.main.antenna_control.set_value()
       
-    rng = self.osmosdr_source.get_bandwidth_range().values()
+    rng = caps['bandwidths']
     if len(rng) == 0:
       self.bandwidth_range = ["%d" % 10**x for x in range(3,9,1)]
     else:
@@ -294,7 +436,7 @@ class Radio(gr.top_block,QWidget):
     self.main.bandwidth_label.setText("RF BW Hz")
     self.main.bandwidth_control.set_value()
     
-    rng = self.osmosdr_source.get_sample_rates().values()
+    rng = caps['sample_rates']
     if len(rng) == 0:
       rates = [int(x*10e6) for x in range(1,24,1)]
     else:
@@ -312,8 +454,9 @@ class Radio(gr.top_block,QWidget):
     self.main.sample_rate_control.set_content(self.sample_rates)
     self.main.sample_rate_control.enable(True)
     self.sample_rate = self.main.sample_rate_control.get_value()
+    self.main.params.set('sample_rate',self.sample_rate)
     if self.device_found:
-      self.osmosdr_source.set_sample_rate(self.sample_rate)
+      self.device.submit('sample_rate',self.sample_rate)
       
     controls = [
       self.main.gain_control_a,
@@ -340,115 +483,177 @@ class Radio(gr.top_block,QWidget):
         control.set_gain_name(name)
         labels[n].setText("%s Gain" % name)
         labels[n].setVisible(True)
-        grange = self.osmosdr_source.get_gain_range(name).values()
-        # get the beginning and end values
-        a,b = grange[1],grange[-1]
+        a,b = caps['gain_ranges'][name]
         control.set_range(a,b)
         control.set_value()
+        
+    if opened:
+      # check the cached entry against the device, queued after
+      # the settings above and run when nothing else is waiting
+      self.submit_probe()
+      
+  # capabilities_probed is called with the result
+  def submit_probe(self):
+    driver = self.device_driver_name
+    future = self.device.submit('probe',DeviceCapabilities.probe)
+    future.add_done_callback(lambda f: self.probe_signal.probed.emit(driver,f))
+    
+  # placeholders while a device without a cache entry is probed,
+  # the radio stays stopped until capabilities_probed rebuilds it
+  def show_probing(self):
+    self.probing = True
+    self.device_found = False
+    self.gain_names = []
+    self.main.run_stop_button.setEnabled(False)
+    self.main.antenna_control.set_content(["Probing ..."])
+    self.main.bandwidth_control.enable(False)
+    self.main.bandwidth_label.setText("Probing device")
+    self.main.sample_rate_control.enable(False)
+    for control,label in (
+      (self.main.gain_control_a,self.main.gain_label_a),
+      (self.main.gain_control_b,self.main.gain_label_b),
+      (self.main.gain_control_c,self.main.gain_label_c),
+      (self.main.gain_control_d,self.main.gain_label_d),
+      ):
+      control.visible(False)
+      label.setVisible(False)
+           
+  # on the GUI thread when a background probe finishes. a
+  # device that differs from its cached entry, or has gone,
+  # gets a rebuild with the fresh capabilities
+  def capabilities_probed(self,driver,future):
+    if future.cancelled():
+      return
+    if future.exception() != None:
+      caps = DeviceCapabilities.no_device()
+    else:
+      caps = future.result()
+    if len(caps['gain_names']) == 0:
+      self.capabilities.invalidate(driver)
+      changed = True
+    else:
+      changed = self.capabilities.store(driver,caps)
+    if (changed or self.probing) and driver == self.currently_configured_device:
+      self.source_caps = caps
+      self.main.full_rebuild_flag = True
+      self.main.run_stop()
+      
+  def capabilities_report(self):
+    return self.capabilities.report()
            
-  # initial setup
+  # the settings that determine which blocks must be rebuilt
+  def config_snapshot(self,config):
+    return {
+      'device' : self.device_driver_name,
+      'sample_rate' : self.sample_rate,
+      'audio_rate' : self.audio_rate,
+      'audio_device' : config['audio_device'],
+      'fft_size' : self.main.fft_size_control.get_value(),
+      'framerate' : self.main.framerate_control.get_value(),
+      'spectrum_merge' : config['spectrum_merge'],
+      'cw_base' : self.cw_base,
+      'hilbert_taps' : self.hilbert_taps_ssb,
+      'front_end_xlate' : config['front_end_xlate'],
+      'ssb_engine' : config['ssb_engine'],
+      'monitor' : self.monitor_selection(config),
+    }
+    
+  # the dial frequency at the center of the device passband
+  def monitor_center(self,config):
+    return config['freq'] + self.lo_offset()
+    
+  # frequency list entries inside the passband, nearest the
+  # center first, or None if monitoring is off
+  def monitor_selection(self,config):
+    if not config['monitor_channels'] or self.sample_rate == None:
+      return None
+    center = self.monitor_center(config)
+    edge = self.sample_rate / 2 - config['monitor_spacing']
+    channels = [c for c in self.main.monitor_channel_list() if abs(c[0] - center) < edge]
+    channels.sort(key = lambda c: abs(c[0] - center))
+    return (config['monitor_spacing'],tuple(channels[:config['monitor_max_channels']]))
+    
+  # keys whose values differ from the last build, all keys on the first
+  def changed_settings(self,snapshot):
+    if self.built_config == None:
+      return set(snapshot.keys())
+    return set([k for k in snapshot if snapshot[k] != self.built_config[k]])
+    
+  # forces the next build to recreate every block except the source
+  def invalidate(self):
+    self.built_config = None
+    
+  # initial setup, later calls rebuild only
+  # the blocks affected by changed settings
   def build_blocks(self,config):
     if not self.device_found:
       return
       
     self.error = False
+    
+    snapshot = self.config_snapshot(config)
+    changed = self.changed_settings(snapshot)
 
-    fft_size = self.main.fft_size_control.get_value()
+    fft_size = snapshot['fft_size']
     
-    frame_rate = self.main.framerate_control.get_value()
+    frame_rate = snapshot['framerate']
     average = self.main.average_control.get_value()
-    ssb_lo = self.ssb_lo
-    ssb_hi = self.ssb_hi
-    
-    USB = self.mode == self.main.MODE_USB or self.mode == self.main.MODE_CW_USB
-      
-    self.audio_dec_nrw = 1
     
-    self.dec_nrw, self.interp_nrw = self.compute_dec_interp(self.sample_rate,self.audio_rate)
-    
-    self.audio_dec_wid = self.if_sample_rate / self.audio_rate
-    
-    self.dec_wid, self.interp_wid = self.compute_dec_interp(self.sample_rate,self.if_sample_rate)
+    # multi-stage decimation from the device rate
+    if len(changed & set(('sample_rate','audio_rate','front_end_xlate'))) > 0:
+      front_end = config['front_end_xlate']
+      self.decimation_plan_nrw = Decimator.DecimationPlan(self.sample_rate,self.audio_rate,front_end=front_end)
+      self.decimation_plan_wid = Decimator.DecimationPlan(self.sample_rate,self.if_sample_rate,front_end=front_end)
           
     volume = .1
     
-    self.configure_source_controls()
-    
-    self.create_update_freq_xlating_fir_filter()
-    
-    self.analog_agc_cc = analog.agc2_cc(1e-1, 1e-2, 1.0, 1.0)
-    self.analog_agc_cc.set_max_gain(1)
-    
-    self.analog_agc_ff = analog.agc2_ff(1e-1, 1e-2, 1.0, 1.0)
-    self.analog_agc_ff.set_max_gain(1)
-        
-    self.rational_resampler_wid = filter.rational_resampler_ccc(
-      decimation=int(self.dec_wid),
-      interpolation=int(self.interp_wid),
-      taps=None,
-      fractional_bw=None,
-        )
-        
-    self.rational_resampler_nrw = filter.rational_resampler_ccc(
-      decimation=int(self.dec_nrw),
-      interpolation=int(self.interp_nrw),
-      taps=None,
-      fractional_bw=None,
-        )
-        
-    self.analog_pwr_squelch = analog.pwr_squelch_cc(self.squelch_level, 1e-4, 0, True)
-    
-    self.analog_pwr_squelch_ssb = analog.pwr_squelch_ff(self.squelch_level, 1e-4, 0, True)
-        
-    self.blocks_multiply = blocks.multiply_vcc(1)
-    self.blocks_complex_to_real = blocks.complex_to_real(1)
-    
-    #self.rebuild_filters(config)
-     
-    self.blocks_complex_to_mag_am = blocks.complex_to_mag(1)
-      
-    self.analog_nbfm_rcv = analog.nbfm_rx(
-        audio_rate=self.audio_rate,
-        quad_rate=self.audio_rate,
-        tau=75e-6,
-        max_dev=6e3,
-        )
-      
-    self.analog_wfm_rcv = analog.wfm_rcv(
-        quad_rate=self.if_sample_rate,
-        audio_decimation=self.audio_dec_wid,
-      )
-      
-    self.hilbert_fc_2 = filter.hilbert_fc(self.hilbert_taps_ssb, firdes.WIN_HAMMING, 6.76)
-    self.hilbert_fc_1 = filter.hilbert_fc(self.hilbert_taps_ssb, firdes.WIN_HAMMING, 6.76)
-    
-    self.blocks_multiply_ssb = blocks.multiply_vcc(1)
-    
-    self.blocks_complex_to_float_ssb = blocks.complex_to_float(1)
-    
-    self.create_usb_lsb_switch()
-    
-    self.blocks_add = blocks.add_vff(1)
-    
-    self.blocks_complex_to_real = blocks.complex_to_real(1)
-    self.blocks_complex_to_imag = blocks.complex_to_imag(1)
+    # cached demodulators survive a rebuild unless
+    # something they were designed around has changed
+    for name in list(self.demodulators.keys()):
+      if len(changed & set(self.demodulators[name].depends)) > 0:
+        del self.demodulators[name]
+    self.cw_offset = self.test_set_cw_offset()
+    self.update_offset_values()
+    self.demodulator = self.get_demodulator(config)
+    
+    if len(changed & set(('sample_rate','audio_rate','monitor'))) > 0:
+      self.monitor = None
+      if snapshot['monitor'] != None:
+        spacing,channels = snapshot['monitor']
+        level = (self.squelch_level,0)[self.squelch_level == None]
+        self.monitor = Channelizer.Channelizer(self.sample_rate,self.audio_rate,spacing,channels,level)
+        self.monitor.retune(self.monitor_center(config))
          
     # this is the source for the FFT display's data  
-    self.logpwrfft = logpwrfft.logpwrfft_c(
-      sample_rate=self.sample_rate,
-      fft_size=fft_size,
-      ref_scale=2,
-      frame_rate=frame_rate,
-      avg_alpha=average,
-      average=(average != 1),
-        )
+    if len(changed & set(('sample_rate','fft_size','framerate','spectrum_merge'))) > 0:
+      self.logpwrfft = logpwrfft.logpwrfft_c(
+        sample_rate=self.sample_rate,
+        fft_size=fft_size,
+        ref_scale=2,
+        frame_rate=frame_rate,
+        avg_alpha=average,
+        average=(average != 1),
+          )
 
-    # this is the main FFT display
-    self.fft_vector_sink = MyVectorSink(self.main,fft_size)
-    
-    self.blocks_multiply_const_volume = blocks.multiply_const_vff((volume, ))
+      # this is the main FFT display
+      self.fft_vector_sink = MyVectorSink(self.main,fft_size,config['spectrum_merge'])
+      
+    if config['waterfall_archive'] and self.recorder == None:
+      self.recorder = WaterfallArchive.Recorder(
+        os.path.join(self.main.config_path,'archive'),
+        config['archive_columns'],config['archive_file_mb'],config['archive_files'])
+    elif not config['waterfall_archive'] and self.recorder != None:
+      self.recorder.close()
+      self.recorder = None
+    self.fft_vector_sink.recorder = self.recorder
+    
+    if self.blocks_multiply_const_volume == None:
+      self.blocks_multiply_const_volume = blocks.multiply_const_vff((volume, ))
+      self.audio_mixer = blocks.add_ff(1)
         
-    # only create this once
+    # the sink must be reopened at a new rate or device
+    if len(changed & set(('audio_rate','audio_device'))) > 0:
+      self.audio_sink = None
     if self.audio_sink == None:
       try:
         self.audio_sink = audio.sink(self.audio_rate, config['audio_device'], True)
@@ -457,8 +662,111 @@ class Radio(gr.top_block,QWidget):
         self.error = True
         self.audio_sink = None
 
+    if not self.error:
+      self.built_config = snapshot
     self.main.af_gain_control.set_value()
+    self.rebuild_memory.append(resident_memory_kb())
+    self.rebuild_memory = self.rebuild_memory[-10:]
        
+  # only the selected mode's demodulator is built,
+  # others are created when first selected
+  def get_demodulator(self,config):
+    cls = self.demodulator_class()
+    if cls == None:
+      return None
+    name = self.main.mode_list[self.mode]
+    if name not in self.demodulators:
+      self.demodulators[name] = cls(self,config)
+    demod = self.demodulators[name]
+    # bring a cached instance up to date
+    demod.rebuild_filters(config['bw_mode'])
+    demod.set_center_freq(self.xlate_freq())
+    if self.squelch_level != None:
+      demod.set_squelch(self.squelch_level)
+    if self.agc_params != None:
+      demod.set_agc(*self.agc_params)
+    return demod
+    
+  # replaces only the demodulator while the source, the
+  # spectrum chain and the audio sink keep running
+  def switch_mode(self,config):
+    t = time.time()
+    self.mode = self.main.mode_control.get_index()
+    self.cw_offset = self.test_set_cw_offset()
+    self.update_offset_values()
+    demod = self.get_demodulator(config)
+    if demod == None:
+      print("mode error -- no recognizable mode selected.")
+      return False
+    if demod is not self.demodulator:
+      self.lock()
+      if self.demodulator != None:
+        self.disconnect((self.osmosdr_source, 0), (self.demodulator, 0))
+        self.disconnect((self.demodulator, 0), (self.audio_input(), 0))
+      self.connect((self.osmosdr_source, 0), (demod, 0))
+      self.connect((demod, 0), (self.audio_input(), 0))
+      self.unlock()
+      self.demodulator = demod
+    self.mode_switch_ms = (time.time() - t) * 1000
+    return True
+    
+  # a live switch needs a running, fully connected graph
+  def can_switch_mode(self):
+    return self.device_found and not self.error and self.demodulator != None
+    
+  def mode_switch_report(self):
+    if self.mode_switch_ms == None:
+      return ''
+    return "Last mode switch %.1f ms, device opened %d time(s)" % (self.mode_switch_ms,self.source_open_count)
+    
+  # demodulated audio enters here, the
+  # mixer when monitored channels are added
+  def audio_input(self):
+    if self.monitor != None:
+      return self.audio_mixer
+    return self.blocks_multiply_const_volume
+    
+  # a retune that moves a channel to another
+  # bank output rewires the channelizer
+  def retune_monitor(self,config):
+    if self.monitor == None:
+      return
+    center = self.monitor_center(config)
+    if self.monitor.needs_rewire(center):
+      self.lock()
+      self.monitor.retune(center)
+      self.unlock()
+    else:
+      self.monitor.retune(center)
+      
+  def monitor_summary(self):
+    if self.monitor == None:
+      return ''
+    return "%d/%d" % (len(self.monitor.open_channels()),len(self.monitor.active_channels()))
+    
+  def monitor_report(self):
+    if self.monitor == None:
+      return ''
+    s = ["Monitor: %d-channel bank, %.0f Hz spacing" % (self.monitor.nchans,self.monitor.spacing)]
+    for c in self.monitor.active_channels():
+      s.append("  %.6f MHz %s %s%s" % (c.freq/1e6,c.mode,c.label,('',' (open)')[c.is_open()]))
+    return '\n'.join(s)
+    
+  def frame_report(self):
+    if self.fft_vector_sink == None:
+      return ''
+    return self.fft_vector_sink.report()
+    
+  def archive_report(self):
+    if self.recorder == None:
+      return ''
+    return self.recorder.report()
+    
+  def memory_report(self):
+    if len(self.rebuild_memory) == 0:
+      return ''
+    return "RSS after recent rebuilds (kB): %s" % ' '.join(["%d" % m for m in self.rebuild_memory])
+    
   def connect_blocks(self,config):
     self.disconnect_all()
     
@@ -472,76 +780,13 @@ class Radio(gr.top_block,QWidget):
     self.connect((self.osmosdr_source, 0), (self.logpwrfft, 0))
     self.connect((self.logpwrfft, 0), (self.fft_vector_sink, 0))
 
-    if self.mode == self.main.MODE_AM:
-      self.connect((self.osmosdr_source, 0), (self.rational_resampler_nrw, 0))
-      self.connect((self.rational_resampler_nrw, 0), (self.freq_xlating_fir_filter, 0))
-      self.connect((self.freq_xlating_fir_filter, 0), (self.low_pass_filter_am, 0))
-      self.connect((self.low_pass_filter_am, 0), (self.analog_pwr_squelch, 0))
-      self.connect((self.analog_pwr_squelch, 0), (self.analog_agc_cc, 0))
-      self.connect((self.analog_agc_cc, 0), (self.blocks_complex_to_mag_am, 0))
-      self.connect((self.blocks_complex_to_mag_am, 0), (self.blocks_multiply_const_volume, 0))
-      self.connect((self.blocks_multiply_const_volume, 0), (self.audio_sink, 0))
-
-    elif self.mode == self.main.MODE_FM:
-      self.connect((self.osmosdr_source, 0), (self.rational_resampler_nrw, 0))
-      self.connect((self.rational_resampler_nrw, 0), (self.freq_xlating_fir_filter, 0))
-      self.connect((self.freq_xlating_fir_filter, 0), (self.low_pass_filter_fm, 0))
-      self.connect((self.low_pass_filter_fm, 0), (self.analog_pwr_squelch, 0))
-      self.connect((self.analog_pwr_squelch, 0), (self.analog_agc_cc, 0))
-      self.connect((self.analog_agc_cc, 0), (self.analog_nbfm_rcv, 0))
-      self.connect((self.analog_nbfm_rcv, 0), (self.blocks_multiply_const_volume, 0))
-      self.connect((self.blocks_multiply_const_volume, 0), (self.audio_sink, 0))
-     
-    elif self.mode == self.main.MODE_WFM:
-      self.connect((self.osmosdr_source, 0), (self.rational_resampler_wid, 0))
-      self.connect((self.rational_resampler_wid, 0), (self.freq_xlating_fir_filter, 0))
-      self.connect((self.freq_xlating_fir_filter, 0), (self.low_pass_filter_wfm, 0))
-      self.connect((self.low_pass_filter_wfm, 0), (self.analog_pwr_squelch, 0))
-      self.connect((self.analog_pwr_squelch, 0), (self.analog_agc_cc, 0))
-      self.connect((self.analog_agc_cc, 0), (self.analog_wfm_rcv, 0)) 
-      self.connect((self.analog_wfm_rcv, 0), (self.blocks_multiply_const_volume, 0))
-      self.connect((self.blocks_multiply_const_volume, 0), (self.audio_sink, 0))
-      
-    elif self.mode == self.main.MODE_USB or self.mode == self.main.MODE_LSB:
-      self.create_usb_lsb_switch()
-      self.connect((self.osmosdr_source, 0), (self.rational_resampler_nrw, 0))
-      self.connect((self.rational_resampler_nrw, 0), (self.freq_xlating_fir_filter, 0))
-      self.connect((self.freq_xlating_fir_filter, 0), (self.analog_pwr_squelch, 0))
-      self.connect((self.analog_pwr_squelch, 0), (self.blocks_complex_to_float_ssb, 0))
-      self.connect((self.blocks_complex_to_float_ssb, 0), (self.hilbert_fc_1, 0))
-      self.connect((self.blocks_complex_to_float_ssb, 1), (self.hilbert_fc_2, 0))
-      self.connect((self.hilbert_fc_1, 0), (self.blocks_complex_to_real, 0))
-      self.connect((self.hilbert_fc_2, 0), (self.blocks_complex_to_imag, 0))
-      self.connect((self.blocks_complex_to_imag, 0), (self.blocks_multiply_const_ssb, 0))
-      self.connect((self.blocks_multiply_const_ssb, 0), (self.blocks_add, 1))
-      self.connect((self.blocks_complex_to_real, 0), (self.blocks_add, 0))
-      self.connect((self.blocks_add, 0), (self.low_pass_filter_ssb, 0))
-      self.connect((self.low_pass_filter_ssb, 0), (self.analog_pwr_squelch_ssb, 0))
-      self.connect((self.analog_pwr_squelch_ssb, 0), (self.analog_agc_ff, 0))
-      self.connect((self.analog_agc_ff, 0), (self.blocks_multiply_const_volume, 0))
-      self.connect((self.blocks_multiply_const_volume, 0), (self.audio_sink, 0))
-        
-    elif self.mode == self.main.MODE_CW_USB or self.mode == self.main.MODE_CW_LSB:
-      self.create_usb_lsb_switch()
-      self.connect((self.osmosdr_source, 0), (self.rational_resampler_nrw, 0))
-      self.connect((self.rational_resampler_nrw, 0), (self.freq_xlating_fir_filter, 0))
-      self.connect((self.freq_xlating_fir_filter, 0), (self.analog_pwr_squelch, 0))
-      self.connect((self.analog_pwr_squelch, 0), (self.blocks_complex_to_float_ssb, 0))
-      self.connect((self.blocks_complex_to_float_ssb, 0), (self.hilbert_fc_1, 0))
-      self.connect((self.blocks_complex_to_float_ssb, 1), (self.hilbert_fc_2, 0))
-      self.connect((self.hilbert_fc_1, 0), (self.blocks_complex_to_real, 0))
-      self.connect((self.hilbert_fc_2, 0), (self.blocks_complex_to_imag, 0))
-      self.connect((self.blocks_complex_to_imag, 0), (self.blocks_multiply_const_ssb, 0))
-      self.connect((self.blocks_multiply_const_ssb, 0), (self.blocks_add, 1))
-      self.connect((self.blocks_complex_to_real, 0), (self.blocks_add, 0))
-      self.connect((self.blocks_add, 0), (self.band_pass_filter_cw, 0))
-      self.connect((self.band_pass_filter_cw, 0), (self.analog_pwr_squelch_ssb, 0))
-      self.connect((self.analog_pwr_squelch_ssb, 0), (self.analog_agc_ff, 0))
-      self.connect((self.analog_agc_ff, 0), (self.blocks_multiply_const_volume, 0))
-
+    if self.demodulator != None:
+      self.connect((self.osmosdr_source, 0), (self.demodulator, 0))
+      self.connect((self.demodulator, 0), (self.audio_input(), 0))
+      if self.monitor != None:
+        self.connect((self.osmosdr_source, 0), (self.monitor, 0))
+        self.connect((self.monitor, 0), (self.audio_mixer, 1))
+        self.connect((self.audio_mixer, 0), (self.blocks_multiply_const_volume, 0))
       self.connect((self.blocks_multiply_const_volume, 0), (self.audio_sink, 0))
-
     else:
       print("mode error -- no recognizable mode selected.")
-      
-    
\ No newline at end of file
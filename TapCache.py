@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#**************************************************************************
+#   Copyright (C) 2018, Paul Lutus                                        *
+#                                                                         *
+#   This program is free software; you can redistribute it and/or modify  *
+#   it under the terms of the GNU General Public License as published by  *
+#   the Free Software Foundation; either version 2 of the License, or     *
+#   (at your option) any later version.                                   *
+#                                                                         *
+#   This program is distributed in the hope that it will be useful,       *
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+#   GNU General Public License for more details.                          *
+#                                                                         *
+#   You should have received a copy of the GNU General Public License     *
+#   along with this program; if not, write to the                         *
+#   Free Software Foundation, Inc.,                                       *
+#   59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.             *
+#**************************************************************************
+
+import os
+import ast
+import collections
+import numpy as np
+
+from gnuradio.filter import firdes
+
+# memoizes firdes designs, keyed on every argument
+# that affects the result, with least-recently-used eviction.
+# the contents can be saved to disk so a warm start
+# skips the design step entirely
+
+class TapCache():
+  def __init__(self,capacity = 64):
+    self.capacity = capacity
+    self.entries = collections.OrderedDict()
+    self.path = None
+    self.hits = 0
+    self.misses = 0
+    self.dirty = False
+
+  def lookup(self,key,design):
+    if key in self.entries:
+      self.entries.move_to_end(key)
+      self.hits += 1
+      return self.entries[key]
+    self.misses += 1
+    taps = tuple(design())
+    self.entries[key] = taps
+    self.dirty = True
+    self.trim()
+    return taps
+
+  def trim(self):
+    while len(self.entries) > self.capacity:
+      self.entries.popitem(last = False)
+
+  def set_capacity(self,capacity):
+    self.capacity = max(1,int(capacity))
+    self.trim()
+
+  def low_pass(self,gain,rate,cutoff,transition,window = firdes.WIN_HAMMING,beta = 6.76):
+    key = ('low_pass',float(gain),float(rate),float(cutoff),float(transition),int(window),float(beta))
+    return self.lookup(key,lambda: firdes.low_pass(gain,rate,cutoff,transition,window,beta))
+
+  def band_pass(self,gain,rate,low,high,transition,window = firdes.WIN_HAMMING,beta = 6.76):
+    key = ('band_pass',float(gain),float(rate),float(low),float(high),float(transition),int(window),float(beta))
+    return self.lookup(key,lambda: firdes.band_pass(gain,rate,low,high,transition,window,beta))
+
+  def complex_band_pass(self,gain,rate,low,high,transition,window = firdes.WIN_HAMMING,beta = 6.76):
+    key = ('complex_band_pass',float(gain),float(rate),float(low),float(high),float(transition),int(window),float(beta))
+    return self.lookup(key,lambda: firdes.complex_band_pass(gain,rate,low,high,transition,window,beta))
+
+  def stats(self):
+    return "Tap cache: %d hits, %d misses, %d/%d entries" % (
+      self.hits,self.misses,len(self.entries),self.capacity)
+
+  # entries are stored oldest first so the
+  # recency order survives a save and load
+  def load(self,path):
+    self.path = path
+    if not os.path.exists(path):
+      return
+    try:
+      with np.load(path) as data:
+        keys = data['keys']
+        for n,key in enumerate(keys):
+          self.entries[ast.literal_eval(str(key))] = tuple(data['t%d' % n].tolist())
+      self.trim()
+    except Exception as e:
+      print("tap cache not loaded: %s" % e)
+      self.entries.clear()
+
+  def save(self):
+    if self.path == None or not self.dirty:
+      return
+    arrays = {'keys' : np.array([repr(k) for k in self.entries.keys()])}
+    for n,taps in enumerate(self.entries.values()):
+      arrays['t%d' % n] = np.array(taps)
+    try:
+      with open(self.path,'wb') as f:
+        np.savez(f,**arrays)
+      self.dirty = False
+    except Exception as e:
+      print("tap cache not saved: %s" % e)
+
+# the application-wide cache
+shared = TapCache()
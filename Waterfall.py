@@ -31,10 +31,18 @@ import random
 
 from PyQt5 import Qt
 from PyQt5 import QtCore,QtGui
-from PyQt5.QtGui import QColor,QImage,QPainter
+from PyQt5.QtGui import QColor,QImage
+from PyQt5 import QtWidgets
 from PyQt5.QtWidgets import QWidget
 from PyQt5.QtCore import QRect,QEvent
 
+import WaterfallArchive
+
+# raw dB rows are kept in a fixed-capacity ring at a fixed
+# column count, the visible image is rendered from the ring,
+# so resizes and color scale changes recolor the history.
+# in viewer mode the rows come from an archive file instead
+
 class WaterfallWidget(QWidget):
   def __init__(self,main,config,parent_widget):
     QWidget.__init__(self)
@@ -49,13 +57,78 @@ class WaterfallWidget(QWidget):
     self.line = 0
     self.bias = self.main.config['waterfall_bias']
     self.drawing = False
+    # the image's pixels as a NumPy array
+    self.pixels = None
+    self.column_indices = {}
+    # history ring, head is the newest row
+    self.capacity = max(1,int(config['waterfall_history']))
+    self.columns = max(1,int(config['waterfall_columns']))
+    self.quantize = config['waterfall_format'] == 'uint8'
+    self.history = np.zeros((self.capacity,self.columns),(np.float16,np.uint8)[self.quantize])
+    self.times = np.zeros(self.capacity)
+    self.head = -1
+    self.count = 0
+    # rows back from the newest, 0 is live
+    self.scroll = 0
+    # frames folded into the next line, which is added
+    # at 'waterfall_rate' lines per second, or every frame if 0
+    self.line_accum = np.zeros(self.columns,np.float32)
+    self.line_frames = 0
+    self.line_due = 0
+    # the archive being viewed, None for the live display
+    self.archive = None
+    # the settings the image was last rendered with
+    self.render_key = None
     self.setup1()
     self.setup2()
     
   def eventFilter(self, object, evt):
-    if evt.type() == QEvent.Wheel:
-      self.bias += (-4,4)[evt.angleDelta().y() > 0]
+    t = evt.type()
+    if t == QEvent.Wheel:
+      up = evt.angleDelta().y() > 0
+      if QtWidgets.QApplication.keyboardModifiers() == QtCore.Qt.ShiftModifier:
+        # scroll back through history
+        step = max(1,self.dh // 10)
+        self.scroll += (-step,step)[up]
+        self.scroll = max(0,min(self.scroll,self.row_count() - 1))
+      else:
+        self.bias += (-4,4)[up]
+      self.update()
+    if t == QEvent.MouseButtonDblClick:
+      # return to the newest row
+      self.scroll = 0
+      self.update()
+    if t == QEvent.ContextMenu:
+      self.context_menu(evt.globalPos())
     return False
+    
+  def context_menu(self,pos):
+    menu = QtWidgets.QMenu(self)
+    view = menu.addAction("View archive ...")
+    live = menu.addAction("Live display")
+    live.setEnabled(self.archive is not None)
+    action = menu.exec_(pos)
+    if action == view:
+      directory = os.path.join(self.main.config_path,'archive')
+      path,_ = QtWidgets.QFileDialog.getOpenFileName(self,"Waterfall archive",directory,"Waterfall archives (*.wfa)")
+      if path:
+        self.view_archive(path)
+    elif action == live:
+      self.view_live()
+      
+  def view_archive(self,path):
+    try:
+      self.archive = WaterfallArchive.Archive(path)
+    except Exception as e:
+      self.main.message_dialog("Archive Error","This archive can't be read: %s" % e)
+      return
+    self.scroll = 0
+    self.update()
+    
+  def view_live(self):
+    self.archive = None
+    self.scroll = 0
+    self.update()
   
   def setup1(self):
     self.colors = []
@@ -63,6 +136,8 @@ class WaterfallWidget(QWidget):
       h = self.ntrp(n,0,256,240,60)
       cn = self.ntrp(n,0,256,80,255)
       self.colors.append(QColor.fromHsv(h,255.0,cn))
+    # the same colors as ARGB pixel values
+    self.lut = np.array([c.rgba() for c in self.colors],np.uint32)
       
   def setup2(self):
     dw = self.dw
@@ -70,8 +145,17 @@ class WaterfallWidget(QWidget):
     self.acquire_essential()
     if dw != self.dw or dh != self.dh:
       self.image = QImage(self.dw,self.dh,QImage.Format_RGB32)
-      p = QPainter(self.image)
-      p.fillRect(0, 0, self.width(), self.height(),QtGui.QColor(0,0,0))
+      self.image.fill(QtGui.QColor(0,0,0))
+      self.pixels = self.image_array(self.image)
+      
+  # a writable view of an RGB32 image's pixels, rows by columns
+  def image_array(self,image):
+    if image.isNull():
+      return None
+    ptr = image.bits()
+    ptr.setsize(image.byteCount())
+    rows = np.frombuffer(ptr,np.uint32).reshape(image.height(),image.bytesPerLine() // 4)
+    return rows[:,:image.width()]
       
   def acquire_essential(self):
     self.dh = self.height()
@@ -79,30 +163,137 @@ class WaterfallWidget(QWidget):
   
   def ntrp(self,x,xa,xb,ya,yb):
     return (x-xa)*(yb-ya)/(xb-xa) + ya
+    
+  def column_index(self,la,width):
+    key = (la,width)
+    if key not in self.column_indices:
+      if len(self.column_indices) > 8:
+        self.column_indices.clear()
+      self.column_indices[key] = (np.arange(width) * la) // width
+    return self.column_indices[key]
+      
+  # one value per column, the peak of the bins
+  # it covers when bins outnumber columns
+  def resample(self,values,width):
+    la = values.shape[-1]
+    index = self.column_index(la,width)
+    if la > width:
+      return np.maximum.reduceat(values,index,axis=-1)
+    return values[...,index]
+    
+  def encode(self,values,out):
+    if self.quantize:
+      WaterfallArchive.quantize(values,out)
+    else:
+      out[...] = values
+    
+  def decode(self,rows):
+    if self.quantize:
+      return WaterfallArchive.dequantize(rows)
+    return rows.astype(np.float32)
+    
+  def row_count(self):
+    if self.archive is not None:
+      return self.archive.count
+    return self.count
+    
+  # dB rows k rows back from the newest
+  def rows_back(self,k):
+    if self.archive is not None:
+      return self.archive.rows(self.archive.count - 1 - k)
+    return self.decode(self.history[(self.head - k) % self.capacity])
+    
+  # dB values to pixels through the color table
+  def colorize(self,values,out = None):
+    lo = self.config['dbscale_lo']
+    hi = self.config['dbscale_hi']
+    y = (values * 4 + (self.bias - lo)) * (255.0 / (hi - lo))
+    np.clip(y,0,255,out=y)
+    return np.take(self.lut,y.astype(np.intp),out=out)
+    
+  def current_key(self):
+    return (self.dw,self.dh,self.bias,self.config['dbscale_lo'],self.config['dbscale_hi'],self.scroll,self.archive)
+    
+  # redraws the whole image from history, newest row at the top
+  def render(self):
+    self.render_key = self.current_key()
+    if self.pixels is None:
+      return
+    self.line = 0
+    self.pixels.fill(0xff000000)
+    n = min(self.dh,self.row_count() - self.scroll)
+    if n > 0:
+      k = np.arange(n)
+      self.pixels[k] = self.colorize(self.resample(self.rows_back(self.scroll + k),self.dw))
+      
+  # row is one line at the history's column count
+  def store(self,row):
+    self.head = (self.head + 1) % self.capacity
+    self.count = min(self.count + 1,self.capacity)
+    self.times[self.head] = time.time()
+    self.encode(row,self.history[self.head])
+    
+  def fold(self,row):
+    if self.line_frames == 0:
+      np.copyto(self.line_accum,row)
+    elif self.config['waterfall_merge'] == 'mean':
+      np.add(self.line_accum,row,out=self.line_accum)
+    else:
+      np.maximum(self.line_accum,row,out=self.line_accum)
+    self.line_frames += 1
+    
+  def line_is_due(self):
+    rate = self.config['waterfall_rate']
+    if rate <= 0:
+      return True
+    now = time.time()
+    if now < self.line_due:
+      return False
+    period = 1.0 / rate
+    self.line_due = max(self.line_due,now - period) + period
+    return True
       
   def accept_data_line(self,array):
-    if not self.drawing and self.isVisible():
+    self.fold(self.resample(array,self.columns))
+    if not self.line_is_due():
+      return
+    if self.config['waterfall_merge'] == 'mean' and self.line_frames > 1:
+      np.multiply(self.line_accum,1.0 / self.line_frames,out=self.line_accum)
+    self.line_frames = 0
+    self.add_line(self.line_accum)
+    
+  def add_line(self,row):
+    self.store(row)
+    if self.archive is not None:
+      return
+    if self.scroll > 0:
+      # hold the view still while scrolled back
+      self.scroll = min(self.scroll + 1,self.count - 1)
+      self.render_key = self.current_key()
+      return
+    if self.pixels is not None and self.render_key == self.current_key():
       self.line = (self.line - 1) % self.dh
-      self.drawing = True
-      qp = QPainter(self.image)
-      
-      la = len(array)
-      ox = None
-      for x,y in enumerate(array):
-        x = self.ntrp(x,0,la,0,self.dw)
-        y = int(self.ntrp(y*4+self.bias,self.config['dbscale_lo'],self.config['dbscale_hi'],0,255))
-        y = (y,0)[y < 0]
-        y = (y,255)[y > 255]
-        if ox != None:
-          qp.setPen(self.colors[y])
-          qp.drawLine(ox,self.line,x,self.line)
-        ox = x
+      row = self.decode(self.history[self.head])
+      self.colorize(self.resample(row,self.dw),self.pixels[self.line])
+    if self.isVisible():
       self.update()
+      
+  # age of the top displayed row when scrolled back,
+  # or its time and frequency when viewing an archive
+  def scroll_label(self):
+    if self.archive is not None:
+      n = self.archive.count - 1 - self.scroll
+      t = time.strftime('%Y-%m-%d %H:%M:%S',time.localtime(self.archive.record_time(n)))
+      return "archive %s %.6f MHz" % (t,self.archive.record_freq(n)/1e6)
+    age = int(time.time() - self.times[(self.head - self.scroll) % self.capacity])
+    return "history -%d:%02d" % (age // 60,age % 60)
     
   def paintEvent(self,event):
     if self.isVisible():
       self.drawing = True
       self.setup2()
+      if self.render_key != self.current_key():
+        self.render()
       qp = QtGui.QPainter(self)
       ha = self.line
       hb = self.dh - ha
@@ -115,6 +306,8 @@ class WaterfallWidget(QWidget):
       
       qp.drawImage(ta,self.image,fa)
       qp.drawImage(tb,self.image,fb)
+      if self.scroll > 0 or self.archive is not None:
+        qp.setPen(QColor(255,255,255))
+        qp.drawText(4,14,self.scroll_label())
       self.drawing = False
     
-    
\ No newline at end of file
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#**************************************************************************
+#   Copyright (C) 2018, Paul Lutus                                        *
+#                                                                         *
+#   This program is free software; you can redistribute it and/or modify  *
+#   it under the terms of the GNU General Public License as published by  *
+#   the Free Software Foundation; either version 2 of the License, or     *
+#   (at your option) any later version.                                   *
+#                                                                         *
+#   This program is distributed in the hope that it will be useful,       *
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+#   GNU General Public License for more details.                          *
+#                                                                         *
+#   You should have received a copy of the GNU General Public License     *
+#   along with this program; if not, write to the                         *
+#   Free Software Foundation, Inc.,                                       *
+#   59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.             *
+#**************************************************************************
+
+import os
+import glob
+import time
+import numpy as np
+
+# long-duration waterfall recording. spectrum rows are
+# quantized to uint8 and appended, with time, center
+# frequency and span, to memory-mapped files that are
+# rotated by size, so hours of history never occupy RAM
+
+# uint8 quantization, 0.75 dB steps from -160 dB
+QUANT_LO = -160.0
+QUANT_STEP = 0.75
+
+MAGIC = b'PLSDRWF1'
+
+HEADER = np.dtype([('magic','S8'),('columns','<u4'),('count','<u4')])
+
+def record_dtype(columns):
+  return np.dtype([('time','<f8'),('freq','<f8'),('span','<f8'),('row','u1',(columns,))])
+
+def quantize(values,out):
+  values = (values - QUANT_LO) * (1.0 / QUANT_STEP) + .5
+  np.clip(values,0,255,out=values)
+  out[...] = values
+
+def dequantize(rows):
+  return rows.astype(np.float32) * QUANT_STEP + QUANT_LO
+
+# one value per column, the peak of the bins it covers
+def peak_columns(values,columns):
+  la = values.shape[-1]
+  index = (np.arange(columns) * la) // columns
+  if la > columns:
+    return np.maximum.reduceat(values,index,axis=-1)
+  return values[...,index]
+
+# archive files in a directory, oldest first
+def archive_files(directory):
+  return sorted(glob.glob(os.path.join(directory,'waterfall_*.wfa')))
+
+class Recorder():
+  def __init__(self,directory,columns = 1024,file_mb = 256,max_files = 8):
+    self.directory = directory
+    if not os.path.exists(directory):
+      os.makedirs(directory)
+    self.columns = int(columns)
+    self.dtype = record_dtype(self.columns)
+    self.capacity = max(1,int(file_mb * 2**20) // self.dtype.itemsize)
+    self.max_files = max(1,int(max_files))
+    self.path = None
+    self.header = None
+    self.records = None
+    self.rows_written = 0
+
+  def open_file(self):
+    self.close()
+    name = time.strftime('waterfall_%Y%m%d_%H%M%S')
+    path = os.path.join(self.directory,name + '.wfa')
+    n = 1
+    while os.path.exists(path):
+      path = os.path.join(self.directory,'%s_%d.wfa' % (name,n))
+      n += 1
+    self.path = path
+    self.header = np.memmap(path,HEADER,'w+',shape=(1,))
+    self.header['magic'] = MAGIC
+    self.header['columns'] = self.columns
+    self.header['count'] = 0
+    # r+ extends the file to its full size
+    self.records = np.memmap(path,self.dtype,'r+',offset=HEADER.itemsize,shape=(self.capacity,))
+    self.prune()
+
+  def prune(self):
+    for path in archive_files(self.directory)[:-self.max_files]:
+      try:
+        os.remove(path)
+      except Exception as e:
+        print("archive file not removed: %s" % e)
+
+  # rows is frames by bins in display order
+  def append(self,rows,freq,span):
+    rows = peak_columns(rows,self.columns)
+    now = time.time()
+    written = 0
+    while written < len(rows):
+      if self.records is None or int(self.header['count'][0]) >= self.capacity:
+        self.open_file()
+      count = int(self.header['count'][0])
+      m = min(len(rows) - written,self.capacity - count)
+      block = self.records[count:count + m]
+      block['time'] = now
+      block['freq'] = freq
+      block['span'] = span
+      quantize(rows[written:written + m],block['row'])
+      self.header['count'] = count + m
+      written += m
+    self.rows_written += written
+
+  def close(self):
+    if self.records is not None:
+      self.records.flush()
+      self.header.flush()
+    self.records = None
+    self.header = None
+
+  def report(self):
+    return "Waterfall archive: %d rows written, %s" % (self.rows_written,self.path)
+
+# read-only view of one archive file, rows
+# are paged in from disk only when indexed
+class Archive():
+  def __init__(self,path):
+    header = np.memmap(path,HEADER,'r',shape=(1,))
+    if header['magic'][0] != MAGIC:
+      raise ValueError("%s is not a waterfall archive" % path)
+    self.path = path
+    self.columns = int(header['columns'][0])
+    self.count = int(header['count'][0])
+    if self.count == 0:
+      raise ValueError("%s is empty" % path)
+    self.records = np.memmap(path,record_dtype(self.columns),'r',offset=HEADER.itemsize,shape=(self.count,))
+
+  def rows(self,index):
+    return dequantize(self.records['row'][index])
+
+  def record_time(self,index):
+    return float(self.records['time'][index])
+
+  def record_freq(self,index):
+    return float(self.records['freq'][index])
@@ -0,0 +1,44 @@
+import os
+
+import numpy as np
+import pytest
+
+pytest.importorskip('gnuradio')
+pytest.importorskip('osmosdr')
+os.environ.setdefault('QT_QPA_PLATFORM','offscreen')
+
+from PyQt5.QtWidgets import QApplication
+
+import Radio
+import WaterfallArchive
+
+class Main():
+  def __init__(self):
+    self.config = {'freq' : 10000000}
+    self.radio = None
+
+  def draw_fft_disp(self):
+    pass
+
+@pytest.fixture(scope='module')
+def app():
+  return QApplication.instance() or QApplication([])
+
+# archived rows are labeled with the spectrum's center,
+# which follows the LO, not the dial frequency
+def test_archive_records_spectrum_center(app,tmp_path):
+  main = Main()
+  radio = Radio.Radio(main)
+  main.radio = radio
+  radio.sample_rate = 2400000
+  recorder = WaterfallArchive.Recorder(str(tmp_path),columns = 8,file_mb = 1)
+  sink = Radio.MyVectorSink(main,8,recorder = recorder)
+  frame = np.full((1,8),-80,np.float32)
+  radio.tune_freq = 10000000
+  for lo in (10100000,9950000):
+    radio.lo_freq = lo
+    sink.work([frame],[])
+  recorder.close()
+  archive = WaterfallArchive.Archive(recorder.path)
+  assert archive.record_freq(0) == 10100000
+  assert archive.record_freq(1) == 9950000
@@ -0,0 +1,37 @@
+import numpy as np
+import pytest
+
+pytest.importorskip('gnuradio')
+
+from gnuradio import analog
+from gnuradio import blocks
+from gnuradio import gr
+
+import Channelizer
+
+SAMPLE_RATE = 240000
+AUDIO_RATE = 48000
+SPACING = 24000
+
+# the AM detector output for a unit tone at offset from the center
+def monitor_level(offset):
+  center = 100e6
+  channelizer = Channelizer.Channelizer(
+    SAMPLE_RATE,AUDIO_RATE,SPACING,[(center + offset,'AM','test')],-200)
+  channelizer.retune(center)
+  tb = gr.top_block()
+  source = analog.sig_source_c(SAMPLE_RATE, analog.GR_COS_WAVE, offset, 1.0, 0)
+  head = blocks.head(gr.sizeof_gr_complex, SAMPLE_RATE)
+  sink = blocks.vector_sink_f()
+  tb.connect(source, head, channelizer, sink)
+  tb.run()
+  data = np.array(sink.data())
+  # past the filters' settling time
+  return np.mean(data[len(data) // 2:])
+
+# a channel 0.45 spacing from its bin center still comes through
+def test_off_bin_tone_survives():
+  on_bin = monitor_level(2 * SPACING)
+  off_bin = monitor_level(2.45 * SPACING)
+  assert on_bin > 0.5
+  assert off_bin > 0.5 * on_bin
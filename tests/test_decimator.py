@@ -0,0 +1,29 @@
+import pytest
+
+pytest.importorskip('gnuradio')
+
+import Decimator
+
+IF_RATE = 240000
+
+def channel_edge(plan,offset):
+  stage = plan.front_end_stage
+  return offset + plan.fractional_bw * plan.rate_out + stage.stop_f - stage.pass_f
+
+# a wide channel retuned in software must keep its edge and
+# the front end's transition band inside the guarded passband
+@pytest.mark.parametrize('rate',[2048000,2400000,3200000])
+def test_wfm_xlate_range_keeps_channel_in_passband(rate):
+  guard = 0.1
+  plan = Decimator.DecimationPlan(rate,IF_RATE,front_end = True)
+  assert plan.front_end_stage != None
+  limit = plan.xlate_range(guard)
+  assert limit > 0
+  assert channel_edge(plan,limit) <= rate * (.5 - guard) + 1e-6
+
+# at low device rates there is no front end, or no room beside
+# the channel and transition band, so every retune moves the LO
+@pytest.mark.parametrize('rate',[250000,1000000,1024000])
+def test_wfm_xlate_range_at_low_device_rate(rate):
+  plan = Decimator.DecimationPlan(rate,IF_RATE,front_end = True)
+  assert plan.xlate_range(0.1) == 0
@@ -0,0 +1,35 @@
+import os
+
+import pytest
+
+os.environ.setdefault('QT_QPA_PLATFORM','offscreen')
+
+from PyQt5.QtWidgets import QApplication,QVBoxLayout
+
+import FFTDisp
+import ParamStore
+
+class Main():
+  def __init__(self):
+    self.params = ParamStore.ParamStore()
+    self.config = {
+      'fft_zoom' : 0,
+      'dbscale_lo' : -140,
+      'dbscale_hi' : 10,
+      'trace_rate' : 0,
+      'disp_trace_color' : '#ffff00',
+      'disp_text_color' : '#80c0ff',
+      'disp_vline_color' : '#c00000',
+    }
+
+@pytest.fixture(scope='module')
+def app():
+  return QApplication.instance() or QApplication([])
+
+# the status line asks for this before the first frame is drawn
+def test_timing_report_before_first_paint(app):
+  main = Main()
+  layout = QVBoxLayout()
+  widget = FFTDisp.FFTDispWidget(main,main.config,layout)
+  assert widget.polygon is None
+  assert "0 points" in widget.timing_report()